@@ -16,19 +16,74 @@ from datalake.common import Metadata
 from datalake.common.errors import NoSuchDatalakeFile
 import simplejson as json
 import re
+from collections import OrderedDict
+from threading import Lock
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 from memoized_property import memoized_property
 from botocore.exceptions import ClientError as BotoClienError
 
 
 _HEADER_BYTES = 1024
+_CHUNK_BYTES = 64 * 1024
+
+
+'''the default number of metadata documents to keep in memory
+
+Datalake files (and therefore their metadata) are immutable. So we can cache
+metadata by file id indefinitely. We just need to bound the size of the cache.
+'''
+DEFAULT_METADATA_CACHE_SIZE = 4096
+
+
+'''the default number of seconds for which presigned urls are valid
+
+These are handed out to clients to be followed immediately, so they need not
+live long.
+'''
+DEFAULT_PRESIGNED_URL_EXPIRY = 300
+
+
+'''the default number of metadata lookups to run at once for batches'''
+DEFAULT_METADATA_CONCURRENCY = 8
+
+
+class UnsatisfiableRange(Exception):
+
+    def __init__(self, message, size=None):
+        super(UnsatisfiableRange, self).__init__(message)
+        self.size = size
 
 
 class ArchiveFile(object):
 
-    def __init__(self, fd, metadata):
+    def __init__(self, fd, metadata, size=None, content_range=None,
+                 magic=None, last_modified=None):
+        '''a datalake file (or a range of one) as fetched from the archive
+
+        Args:
+
+        fd: file-like object from which the content can be read.
+
+        metadata: the datalake metadata of the file.
+
+        size: the total size of the file in bytes, if known.
+
+        content_range: for partial content, a tuple of the first and last
+        byte offsets (inclusive) of the file that fd holds.
+
+        magic: the first few bytes of the file. This is only needed when fd
+        does not start at the beginning of the file.
+
+        last_modified: the time the file was stored.
+        '''
         self.fd = fd
         self.metadata = metadata
+        self.size = size
+        self.content_range = content_range
+        self.last_modified = last_modified
         self._header = self.fd.read(_HEADER_BYTES)
+        self._magic = self._header if magic is None else magic
         self._read_done = False
 
     _has_trailing_checksum = re.compile(r'(?P<path>.+)-[0-9a-f]{32,40}?')
@@ -59,33 +114,218 @@ class ArchiveFile(object):
         self._read_done = True
         return self._header + self.fd.read()
 
+    def iter_content(self, chunk_size=_CHUNK_BYTES):
+        '''generate the file contents in chunks of at most chunk_size'''
+        if self._read_done:
+            return
+        self._read_done = True
+        try:
+            if self._header:
+                yield self._header
+            while True:
+                chunk = self.fd.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            self.fd.close()
+
     _GZIP_MAGIC_NUMBERS = b"\x1f\x8b\x08"
 
     def _is_gzip(self):
         # Thanks to:
         # http://stackoverflow.com/questions/13044562/python-mechanism-to-identify-compressed-file-type-and-uncompress  # noqa
-        return self._header.startswith(self._GZIP_MAGIC_NUMBERS)
+        return self._magic.startswith(self._GZIP_MAGIC_NUMBERS)
+
+    def close(self):
+        self.fd.close()
+
+
+class MetadataCache(object):
+    '''a thread-safe LRU cache of file id to Metadata'''
+
+    def __init__(self, max_size=DEFAULT_METADATA_CACHE_SIZE):
+        self.max_size = max_size
+        self._cache = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, file_id):
+        with self._lock:
+            m = self._cache.get(file_id)
+            if m is None:
+                return None
+            self._cache.move_to_end(file_id)
+        # callers are free to decorate the metadata they get. So hand out a
+        # copy.
+        return Metadata(m)
+
+    def put(self, file_id, metadata):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._cache[file_id] = metadata
+            self._cache.move_to_end(file_id)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def __len__(self):
+        return len(self._cache)
 
 
 class ArchiveFileFetcher(object):
 
-    def __init__(self, s3_bucket):
+    def __init__(self, s3_bucket,
+                 metadata_cache_size=DEFAULT_METADATA_CACHE_SIZE,
+                 metadata_concurrency=DEFAULT_METADATA_CONCURRENCY):
         self.s3_bucket = s3_bucket
+        self.metadata_cache = MetadataCache(metadata_cache_size)
+        self.metadata_concurrency = metadata_concurrency or 1
+
+    def get_file(self, file_id, byte_range=None):
+        '''get a file (or part of it) from the archive
+
+        Args:
+
+        file_id: the id of the file to get.
 
-    def get_file(self, file_id):
-        key = self._get_s3_key(file_id)
+        byte_range: an HTTP byte-range-spec (e.g., '0-99', '100-', or '-100')
+        that limits the content to a single range of the file.
+
+        Raises NoSuchDatalakeFile if there is no such file and
+        UnsatisfiableRange if byte_range does not overlap the file.
+        '''
+        key = self._get_s3_key(file_id, byte_range)
         fd = key['Body']
-        j = json.loads(key['Metadata']['datalake'])
-        metadata = Metadata(j)
-        return ArchiveFile(fd, metadata)
+        metadata = self._parse_metadata(key['Metadata'])
+        self.metadata_cache.put(file_id, metadata)
+        kwargs = dict(size=key['ContentLength'],
+                      last_modified=key.get('LastModified'))
+        if 'ContentRange' in key:
+            first, last, size = self._parse_content_range(key['ContentRange'])
+            kwargs.update(size=size, content_range=(first, last))
+            if first != 0:
+                kwargs.update(magic=self._get_magic(file_id))
+        return ArchiveFile(fd, Metadata(metadata), **kwargs)
+
+    _content_range = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
+    def _parse_content_range(self, content_range):
+        m = self._content_range.match(content_range)
+        return tuple(int(g) for g in m.groups())
 
-    def _get_s3_key(self, file_id):
-        path = '{}/data'.format(file_id)
+    _MAGIC_BYTES = 4
+
+    def _get_magic(self, file_id):
+        key = self._get_s3_key(file_id, '0-{}'.format(self._MAGIC_BYTES - 1))
+        return key['Body'].read()
+
+    def get_presigned_url(self, file_id,
+                          expires_in=DEFAULT_PRESIGNED_URL_EXPIRY):
+        '''get a short-lived s3 url from which the file can be fetched
+
+        The url overrides the content type and encoding of the response to
+        match what the API would serve. Raises NoSuchDatalakeFile if there is
+        no such file.
+        '''
+        metadata = self.get_metadata(file_id)
         try:
-            return self.s3_bucket.Object(path).get()
-        except BotoClienError as e:
-            if e.response['ResponseMetadata']['HTTPStatusCode'] == 404:
-                msg = 'No file with id {} exists'.format(file_id)
-                raise NoSuchDatalakeFile(msg)
+            magic = self._get_magic(file_id)
+        except UnsatisfiableRange:
+            # an empty file
+            magic = b''
+        f = ArchiveFile(BytesIO(magic), metadata)
+        params = {
+            'Bucket': self.s3_bucket.name,
+            'Key': self._get_s3_path(file_id),
+            'ResponseContentType': f.content_type or 'text/plain',
+        }
+        if f.content_encoding is not None:
+            params['ResponseContentEncoding'] = f.content_encoding
+        client = self.s3_bucket.meta.client
+        return client.generate_presigned_url('get_object', Params=params,
+                                             ExpiresIn=expires_in)
+
+    def get_metadata(self, file_id):
+        '''get the metadata for a file without fetching its content'''
+        metadata = self.metadata_cache.get(file_id)
+        if metadata is not None:
+            return metadata
+        obj = self._head_s3_key(file_id)
+        metadata = self._parse_metadata(obj.metadata)
+        self.metadata_cache.put(file_id, metadata)
+        return Metadata(metadata)
+
+    def get_metadata_many(self, file_ids):
+        '''get the metadata for many files at once
+
+        Returns a dict of file id to metadata. The metadata is None for files
+        that do not exist. Lookups that miss the cache run concurrently.
+        '''
+        results = {}
+        misses = []
+        for file_id in file_ids:
+            metadata = self.metadata_cache.get(file_id)
+            if metadata is None:
+                misses.append(file_id)
             else:
-                raise
+                results[file_id] = metadata
+        misses = list(OrderedDict.fromkeys(misses))
+        metadata = self._executor.map(self._get_metadata_or_none, misses)
+        results.update(zip(misses, metadata))
+        return results
+
+    def _get_metadata_or_none(self, file_id):
+        try:
+            return self.get_metadata(file_id)
+        except NoSuchDatalakeFile:
+            return None
+
+    @memoized_property
+    def _executor(self):
+        # NB: the lookups share the bucket resource across threads. This is
+        # safe because each creates its own Object and only issues requests
+        # through the (thread-safe) low-level client.
+        return ThreadPoolExecutor(max_workers=self.metadata_concurrency)
+
+    def _parse_metadata(self, s3_metadata):
+        j = json.loads(s3_metadata['datalake'])
+        return Metadata(j)
+
+    def _get_s3_path(self, file_id):
+        return '{}/data'.format(file_id)
+
+    def _get_s3_key(self, file_id, byte_range=None):
+        path = self._get_s3_path(file_id)
+        kwargs = {}
+        if byte_range is not None:
+            kwargs['Range'] = 'bytes=' + byte_range
+        try:
+            return self.s3_bucket.Object(path).get(**kwargs)
+        except BotoClienError as e:
+            self._raise_if_not_found(e, file_id)
+            self._raise_if_unsatisfiable(e, file_id)
+            raise
+
+    def _head_s3_key(self, file_id):
+        obj = self.s3_bucket.Object(self._get_s3_path(file_id))
+        try:
+            # load() issues a HEAD request and populates the object's
+            # attributes (e.g., metadata, content_length).
+            obj.load()
+        except BotoClienError as e:
+            self._raise_if_not_found(e, file_id)
+            raise
+        return obj
+
+    def _raise_if_not_found(self, e, file_id):
+        if e.response['ResponseMetadata']['HTTPStatusCode'] == 404:
+            msg = 'No file with id {} exists'.format(file_id)
+            raise NoSuchDatalakeFile(msg)
+
+    def _raise_if_unsatisfiable(self, e, file_id):
+        if e.response['ResponseMetadata']['HTTPStatusCode'] == 416:
+            size = e.response['Error'].get('ActualObjectSize')
+            if size is None:
+                size = self._head_s3_key(file_id).content_length
+            msg = 'Requested range is not satisfiable for file {}'
+            raise UnsatisfiableRange(msg.format(file_id), size=int(size))
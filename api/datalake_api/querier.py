@@ -15,6 +15,7 @@
 from memoized_property import memoized_property
 from datalake.common import DatalakeRecord
 from boto3.dynamodb.conditions import Key
+from concurrent.futures import ThreadPoolExecutor
 import base64
 import json
 import time
@@ -33,20 +34,99 @@ dynamodb will return a max of 1MB to us. And our documents could be
 MAX_RESULTS = 100
 
 
+'''the maximum number of projected results to return to the user
+
+When the user only asks for some fields of each record (see
+get_max_results), the records are much smaller. So we can return more of them
+in a page of about the same size. Note that we page through dynamodb's 1MB
+responses within a page of results as needed.
+'''
+MAX_PROJECTED_RESULTS = 1000
+
+
+# approximate sizes of records and their attributes in bytes
+_RECORD_BYTES = 2000
+_ATTRIBUTE_BYTES = {
+    'url': 128,
+    'metadata': _RECORD_BYTES,
+    'metadata.path': 256,
+}
+_DEFAULT_ATTRIBUTE_BYTES = 64
+
+
+'''the record attributes that the querier itself needs
+
+These are always fetched, even for projected queries, because they are needed
+to filter, deduplicate and page through the results.
+'''
+_REQUIRED_ATTRIBUTES = ['time_index_key', 'range_key', 'metadata.id',
+                        'metadata.start', 'metadata.end']
+
+
 '''the default number of days to lookback for latest files
 
-We do not index the latest files as such. Instead, we naively scan backwards
-through each time bucket looking for the expected file. We will not look
-arbitrarily far back, though, because this makes the failing case terribly
-slow and expensive.
+Unless the latest table is in use, we do not index the latest files as such.
+Instead, we probe backwards through the time buckets looking for the expected
+file. We will not look arbitrarily far back, though, because this makes the
+failing case slow and expensive.
 '''
 DEFAULT_LOOKBACK_DAYS = 14
 LATEST_MAX_LOOKFORWARD_HOURS = 24
 
 
+'''the maximum number of buckets to probe at once when searching for latest'''
+LATEST_MAX_PROBE_WINDOW = 16
+
+
+'''the default number of time buckets to query concurrently
+
+Time-based queries make one dynamodb query per time bucket. When this is
+greater than 1, we query a window of upcoming buckets in parallel and assemble
+the page from those responses. A value of 1 queries the buckets serially.
+'''
+DEFAULT_QUERY_CONCURRENCY = 1
+
+
+'''the maximum number of keys that dynamodb accepts in a BatchGetItem'''
+BATCH_GET_SIZE = 100
+
+
+'''the number of times to ask for unprocessed keys of a BatchGetItem
+
+dynamodb may not process all of the keys in a batch (e.g., when throttled). We
+ask again for the leftovers with exponential backoff. Keys that remain
+unprocessed after this many attempts are treated as misses.
+'''
+BATCH_GET_ATTEMPTS = 5
+_BATCH_GET_BACKOFF_SECONDS = 0.05
+
+
+'''the latest table index of the latest record for every where of a what
+
+The ingester stores the what and where of each latest record as what_key and
+where_key, which are the hash and range keys of this global secondary index.
+'''
+LATEST_WHAT_INDEX = 'what-index'
+
+
 _ONE_DAY_MS = 24 * 60 * 60 * 1000
 
 
+def get_max_results(attributes=None):
+    '''get the maximum page size for results projected to attributes
+
+    attributes are the record attributes (e.g., url or metadata.id) that the
+    user wants. Pages of full records are limited to MAX_RESULTS. Pages of
+    smaller records may be larger, up to MAX_PROJECTED_RESULTS.
+    '''
+    if not attributes:
+        return MAX_RESULTS
+    size = sum(_ATTRIBUTE_BYTES.get(a, _DEFAULT_ATTRIBUTE_BYTES)
+               for a in attributes)
+    n = MAX_RESULTS * _RECORD_BYTES // size
+    return max(MAX_RESULTS, min(n, MAX_PROJECTED_RESULTS))
+
+
 class InvalidCursor(Exception):
     pass
 
@@ -54,11 +134,11 @@ class InvalidCursor(Exception):
 class Cursor(dict):
     '''a cursor to retrieve the next page of results in a query
 
-    We never return more than MAX_RESULTS to the user. For work_id-based
-    queries, we achive this by passing Limit=MAX_RESULTS to dynamodb. If we get
-    back a non-null LastEvaluated, we stash that in the cursor so we can pass
-    it as ExclusiveStartKey. The LastEvaluated key contains the range key which
-    contains the last ID that we saw. We use this to prevent sending duplicate
+    We never return more than the page limit (MAX_RESULTS by default) to the
+    user. For work_id-based queries, we achive this by passing the limit to
+    dynamodb. If we get back a non-null LastEvaluated, we stash that in the
+    cursor so we can pass it as ExclusiveStartKey. The LastEvaluated key
+    contains the range key which contains the last ID that we saw. We use this to prevent sending duplicate
     records from page to page. This scheme is not perfect. For example, if
     there are many files with the same work-id that span many time buckets we
     will fail to deduplicate them. But this is a rare case.
@@ -67,11 +147,11 @@ class Cursor(dict):
     dynamodb for each time bucket. We query each bucket with
     Limit=MAX_RESULTS/2 until we have more than MAX_RESULTS/2 total results, or
     until we get a non-null LastEvaluated. We encode the current time bucket
-    and LastEvaluated into the cursor. There's just no good way to guarantee
-    that we deduplicate across pages. Minimally, we'd have to encode the
-    last_id for every "where" in each batch into the cursor. This could get
-    pretty unweildy. We still use the last ID that we saw to de-duplicate the
-    (common?) case in which only a single "where" is in play.
+    and LastEvaluated into the cursor. A record that spans many time buckets
+    appears in each of them. But we only return it from the first of those
+    buckets that the query covers (its "home" bucket). So no record appears on
+    more than one page, and the cursor need not remember what we have already
+    returned.
 
     '''
     def __init__(self, **kwargs):
@@ -163,12 +243,11 @@ class QueryResults(list):
         return [unpack(r) for r in records if not _already_seen(r)]
 
     def _unpack(self, result):
-        r = dict(url=result['url'],
-                 metadata=result['metadata'])
+        r = dict(metadata=result['metadata'])
 
         # some fields were added later. Tolerate their absence to buy migration
-        # time.
-        for extra in ['create_time', 'size']:
+        # time. And projected queries may leave out the url.
+        for extra in ['url', 'create_time', 'size']:
             if extra in result:
                 r[extra] = result[extra]
 
@@ -182,25 +261,34 @@ class ArchiveQuerier(object):
     def __init__(self, table_name,
                  latest_table_name=None,
                  use_latest_table=None,
-                 dynamodb=None):
+                 dynamodb=None,
+                 query_concurrency=DEFAULT_QUERY_CONCURRENCY):
         self.table_name = table_name
         self.latest_table_name = latest_table_name
         self.use_latest_table = use_latest_table
         self.dynamodb = dynamodb
-        
+        self.query_concurrency = query_concurrency or 1
+
+    def query_by_work_id(self, work_id, what, where=None, cursor=None,
+                         attributes=None, limit=MAX_RESULTS):
+        '''query for records with the given work_id
 
-    def query_by_work_id(self, work_id, what, where=None, cursor=None):
-        kwargs = self._prepare_work_id_kwargs(work_id, what)
+        If attributes is specified, the records are projected to just these
+        attributes (plus a few that we require). The page of results holds at
+        most limit records.
+        '''
+        kwargs = self._prepare_work_id_kwargs(work_id, what, limit)
         if where is not None:
             self._add_range_key_condition(kwargs, where)
         if cursor is not None:
             self._add_cursor_conditions(kwargs, cursor)
+        self._add_projection(kwargs, attributes)
 
         response = self._table.query(**kwargs)
         cursor = self._cursor_for_work_id_query(response)
         return QueryResults(response['Items'], cursor)
 
-    def _prepare_work_id_kwargs(self, work_id, what):
+    def _prepare_work_id_kwargs(self, work_id, what, limit=MAX_RESULTS):
         i = work_id + ':' + what
         return {
             'IndexName': 'work-id-index',
@@ -211,7 +299,7 @@ class ArchiveQuerier(object):
                 ':v0': i
             },
             'KeyConditionExpression': '#n0 = :v0',
-            'Limit': MAX_RESULTS,
+            'Limit': limit,
         }
 
     def _add_range_key_condition(self, kwargs, where):
@@ -220,6 +308,25 @@ class ArchiveQuerier(object):
         kwargs['ExpressionAttributeNames']['#n1'] = 'range_key'
         kwargs['ExpressionAttributeValues'][':v1'] = where + ':'
 
+    def _add_projection(self, kwargs, attributes):
+        if not attributes:
+            return
+        attributes = set(attributes) | set(_REQUIRED_ATTRIBUTES)
+        if 'metadata' in attributes:
+            # dynamodb rejects overlapping paths
+            attributes = [a for a in attributes
+                          if not a.startswith('metadata.')]
+        names = kwargs['ExpressionAttributeNames']
+        paths = []
+        for attribute in sorted(attributes):
+            path = []
+            for part in attribute.split('.'):
+                name = '#p{}'.format(len(names))
+                names[name] = part
+                path.append(name)
+            paths.append('.'.join(path))
+        kwargs['ProjectionExpression'] = ', '.join(paths)
+
     def _cursor_for_work_id_query(self, response):
         last_evaluated = response.get('LastEvaluatedKey')
         if last_evaluated is None:
@@ -237,7 +344,14 @@ class ArchiveQuerier(object):
             kwargs["ExpressionAttributeNames"]["#n3"] = "id"
             kwargs["ExpressionAttributeValues"][":v2"] = cursor.last_id
 
-    def query_by_time(self, start, end, what, where=None, cursor=None):
+    def query_by_time(self, start, end, what, where=None, cursor=None,
+                      attributes=None, limit=MAX_RESULTS):
+        '''query for records that intersect the time interval
+
+        See query_by_work_id for attributes and limit.
+        '''
+        query = dict(what=what, where=where, attributes=attributes,
+                     limit=limit)
         results = []
         buckets = DatalakeRecord.get_time_buckets(start, end)
 
@@ -246,9 +360,14 @@ class ArchiveQuerier(object):
             i = buckets.index(current_bucket)
             buckets = buckets[i:]
 
-        for b in buckets:
-            cursor = self._query_time_bucket(b, results, start, end, what,
-                                             where, cursor)
+        prefetched = {}
+        for i, b in enumerate(buckets):
+            if self._should_prefetch(b, prefetched, results, cursor, limit):
+                window = buckets[i:i + self.query_concurrency]
+                prefetched = self._prefetch_time_buckets(window, **query)
+            cursor = self._query_time_bucket(
+                b, results, start, end, cursor=cursor,
+                prefetched=prefetched.pop(b, None), **query)
 
         if cursor and \
            cursor.current_time_bucket and \
@@ -260,31 +379,99 @@ class ArchiveQuerier(object):
 
         return QueryResults(results, cursor)
 
-    def _query_time_bucket(self, bucket, results, start, end, what,
-                           where=None, cursor=None):
-        headroom = MAX_RESULTS - len(results)
-        new_results = []
-        while headroom > 0:
+    def _should_prefetch(self, bucket, prefetched, results, cursor,
+                         limit=MAX_RESULTS):
+        if self.query_concurrency <= 1:
+            return False
+        if bucket in prefetched or len(results) >= limit:
+            return False
+        # a bucket that we resume with a cursor needs ExclusiveStartKey and
+        # the duplicate filter. So we leave it to the serial path.
+        return cursor is None
+
+    def _prefetch_time_buckets(self, buckets, what, where=None,
+                               attributes=None, limit=MAX_RESULTS):
+        '''query the first page of each bucket in parallel
+
+        Returns a dict of bucket to response. Each query asks for a full page
+        so that the response can later be trimmed to whatever headroom is left
+        when the bucket is reached (see _trim_response).
+        '''
+        def _query(bucket):
             kwargs = self._prepare_time_bucket_kwargs(bucket, what,
-                                                      limit=headroom)
+                                                      limit=limit)
             if where is not None:
                 self._add_range_key_condition(kwargs, where)
-            if cursor is not None:
-                self._add_cursor_conditions(kwargs, cursor)
-            response = self._table.query(**kwargs)
-            new_results = self._exclude_outside(response['Items'], start, end)
+            self._add_projection(kwargs, attributes)
+            return self._table.query(**kwargs)
+
+        responses = self._executor.map(_query, buckets)
+        return dict(zip(buckets, responses))
+
+    def _trim_response(self, response, limit):
+        '''make a prefetched response look like a query with Limit=limit
+
+        The prefetched query used a larger limit. If it returned more items
+        than we have headroom for, drop the extras and point LastEvaluatedKey
+        at the last item we kept, which is exactly what dynamodb would have
+        returned to the serial query.
+        '''
+        items = response['Items']
+        if len(items) <= limit:
+            return response
+        items = items[:limit]
+        last = items[-1]
+        return {
+            'Items': items,
+            'LastEvaluatedKey': {
+                'time_index_key': last['time_index_key'],
+                'range_key': last['range_key'],
+            },
+        }
+
+    def _query_time_bucket(self, bucket, results, start, end, what,
+                           where=None, cursor=None, prefetched=None,
+                           attributes=None, limit=MAX_RESULTS):
+        headroom = limit - len(results)
+        new_results = []
+        while headroom > 0:
+            if prefetched is not None:
+                response = self._trim_response(prefetched, headroom)
+                prefetched = None
+            else:
+                kwargs = self._prepare_time_bucket_kwargs(bucket, what,
+                                                          limit=headroom)
+                if where is not None:
+                    self._add_range_key_condition(kwargs, where)
+                if cursor is not None:
+                    self._add_cursor_conditions(kwargs, cursor)
+                self._add_projection(kwargs, attributes)
+                response = self._table.query(**kwargs)
+            new_results = self._exclude_outside(response['Items'], start, end,
+                                                bucket)
             results += new_results
-            # we _could_ deduplicate the results here to make more headroom
-            # for another bucket.
-            cursor = self._cursor_for_time_query(response, results, bucket)
+            cursor = self._cursor_for_time_query(response, results, bucket,
+                                                 limit)
             if cursor is None:
                 # no more results in the bucket
                 break
-            headroom = MAX_RESULTS - len(results)
+            headroom = limit - len(results)
         return cursor
 
-    def _exclude_outside(self, records, start, end):
-        return [r for r in records if self._intersects_time(r, start, end)]
+    def _exclude_outside(self, records, start, end, bucket):
+        return [r for r in records if self._intersects_time(r, start, end) and
+                self._is_home_bucket(r, start, bucket)]
+
+    def _is_home_bucket(self, record, start, bucket):
+        '''return true if bucket is the first queried bucket with the record
+
+        The record appears in each time bucket that it spans. The first of
+        these that a query starting at start covers is the bucket of the later
+        of the two start times.
+        '''
+        d = DatalakeRecord.TIME_BUCKET_SIZE_IN_MS
+        home = int(max(record['metadata']['start'], start) / d)
+        return home == bucket
 
     def _intersects_time(self, record, start, end):
         '''return true if a record intersects the specified time interval
@@ -318,11 +505,12 @@ class ArchiveQuerier(object):
             kwargs.update(Limit=limit)
         return kwargs
 
-    def _cursor_for_time_query(self, response, results, current_bucket):
+    def _cursor_for_time_query(self, response, results, current_bucket,
+                               limit=MAX_RESULTS):
         last_evaluated = response.get('LastEvaluatedKey')
 
         if last_evaluated is None:
-            if len(results) < MAX_RESULTS:
+            if len(results) < limit:
                 # There are no more results in this bucket, but there's enough
                 # headroom for records from another bucket.
                 return None
@@ -340,6 +528,13 @@ class ArchiveQuerier(object):
             return Cursor(last_evaluated=last_evaluated,
                           current_time_bucket=current_bucket)
 
+    @memoized_property
+    def _executor(self):
+        # NB: the queries share the table resource across threads. This is
+        # safe because query does not mutate the resource; it only issues
+        # requests through the (thread-safe) low-level client.
+        return ThreadPoolExecutor(max_workers=self.query_concurrency)
+
     @memoized_property
     def _table(self):
         return self.dynamodb.Table(self.table_name)
@@ -364,16 +559,7 @@ class ArchiveQuerier(object):
                 return self._default_latest(what, where, lookback_days)
 
             latest_item = items[0]
-            metadata_start = latest_item['metadata']['start']
-
-            if isinstance(metadata_start, (int, decimal.Decimal)):
-                metadata_start = datetime.utcfromtimestamp(float(metadata_start) / 1000)
-
-            elif isinstance(metadata_start, str):
-                metadata_start = datetime.strptime(metadata_start, '%Y-%m-%dT%H:%M:%S.%fZ')
-
-            if metadata_start > max_lookforward:
-                log.info(f"Record with metadata.start {metadata_start} is beyond MAX_LOOKFORWARD_HOURS. Falling back to default latest.")
+            if self._is_beyond_lookforward(latest_item, max_lookforward):
                 return self._default_latest(what, where, lookback_days)
 
             return dict(url=latest_item['url'], metadata=latest_item['metadata'])
@@ -381,6 +567,107 @@ class ArchiveQuerier(object):
         else:
             return self._default_latest(what, where, lookback_days)
 
+    def _is_beyond_lookforward(self, item, max_lookforward):
+        metadata_start = item['metadata']['start']
+
+        if isinstance(metadata_start, (int, decimal.Decimal)):
+            metadata_start = datetime.utcfromtimestamp(float(metadata_start) / 1000)
+
+        elif isinstance(metadata_start, str):
+            metadata_start = datetime.strptime(metadata_start, '%Y-%m-%dT%H:%M:%S.%fZ')
+
+        if metadata_start > max_lookforward:
+            log.info(f"Record with metadata.start {metadata_start} is beyond MAX_LOOKFORWARD_HOURS. Falling back to default latest.")
+            return True
+        return False
+
+    def query_latest_many(self, pairs, lookback_days=DEFAULT_LOOKBACK_DAYS):
+        '''query the latest records for many (what, where) pairs
+
+        Returns a dict of (what, where) to the latest record, or None if there
+        is none. If the latest table is in use, we read it in batches and only
+        query pairs that it misses one at a time.
+        '''
+        pairs = list(dict.fromkeys(tuple(p) for p in pairs))
+        items = {}
+        if self.use_latest_table:
+            items = self._batch_get_latest_items(pairs)
+
+        now = datetime.utcnow()
+        max_lookforward = now + timedelta(hours=LATEST_MAX_LOOKFORWARD_HOURS)
+        results = {}
+        for what, where in pairs:
+            item = items.get((what, where))
+            if item is None or \
+               self._is_beyond_lookforward(item, max_lookforward):
+                results[(what, where)] = self._default_latest(what, where,
+                                                              lookback_days)
+            else:
+                results[(what, where)] = dict(url=item['url'],
+                                              metadata=item['metadata'])
+        return results
+
+    def query_latest_by_what(self, what,
+                             lookback_days=DEFAULT_LOOKBACK_DAYS):
+        '''query the latest record for every where of what
+
+        Returns a list of the latest records sorted by where, or None if the
+        latest table is not in use. We page through the what index of the
+        latest table rather than querying each where one at a time.
+        '''
+        if not self.use_latest_table:
+            return None
+
+        now = datetime.utcnow()
+        max_lookforward = now + timedelta(hours=LATEST_MAX_LOOKFORWARD_HOURS)
+        kwargs = {
+            'IndexName': LATEST_WHAT_INDEX,
+            'KeyConditionExpression': Key('what_key').eq(what),
+        }
+        records = []
+        while True:
+            response = self._latest_table.query(**kwargs)
+            for item in response['Items']:
+                if self._is_beyond_lookforward(item, max_lookforward):
+                    where = item['metadata']['where']
+                    r = self._default_latest(what, where, lookback_days)
+                    if r is not None:
+                        records.append(r)
+                else:
+                    records.append(dict(url=item['url'],
+                                        metadata=item['metadata']))
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return sorted(records, key=lambda r: r['metadata']['where'])
+
+    def _batch_get_latest_items(self, pairs):
+        keys = {'{}:{}'.format(what, where): (what, where)
+                for what, where in pairs}
+        key_names = list(keys)
+        items = {}
+        for i in range(0, len(key_names), BATCH_GET_SIZE):
+            batch = key_names[i:i + BATCH_GET_SIZE]
+            for item in self._batch_get_latest_table(batch):
+                items[keys[item['what_where_key']]] = item
+        return items
+
+    def _batch_get_latest_table(self, keys):
+        name = self.latest_table_name
+        request = {name: {'Keys': [{'what_where_key': k} for k in keys]}}
+        items = []
+        for attempt in range(BATCH_GET_ATTEMPTS):
+            if attempt > 0:
+                time.sleep(_BATCH_GET_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            response = self.dynamodb.batch_get_item(RequestItems=request)
+            items += response['Responses'].get(name, [])
+            request = response.get('UnprocessedKeys')
+            if not request:
+                return items
+        n = len(request[name]['Keys'])
+        log.warning(f'{n} keys remain unprocessed in the latest table')
+        return items
+
     def _get_latest_record_in_bucket(self, bucket, what, where):
         kwargs = self._prepare_time_bucket_kwargs(bucket, what)
         self._add_range_key_condition(kwargs, where)
@@ -406,13 +693,63 @@ class ArchiveQuerier(object):
     
     def _default_latest(self, what, where, lookback_days=DEFAULT_LOOKBACK_DAYS):
         log.info("Using default latest behavior")
+        buckets = self._get_lookback_buckets(lookback_days)
+        if not buckets:
+            return None
+
+        # the common case is that the latest file is in the current bucket. So
+        # check it straight away before we start probing.
+        r = self._get_latest_record_in_bucket(buckets[0], what, where)
+        if r is not None:
+            return r
+
+        bucket = self._find_newest_nonempty_bucket(buckets[1:], what, where)
+        if bucket is None:
+            return None
+        return self._get_latest_record_in_bucket(bucket, what, where)
+
+    def _get_lookback_buckets(self, lookback_days):
+        '''return the buckets to search for latest, newest first'''
+        buckets = []
         current = int(time.time() * 1000)
         end = current - lookback_days * _ONE_DAY_MS
         while current >= end:
-            bucket = current/DatalakeRecord.TIME_BUCKET_SIZE_IN_MS
-            r = self._get_latest_record_in_bucket(bucket, what, where)
-            if r is not None:
-                return r
+            buckets.append(int(current/DatalakeRecord.TIME_BUCKET_SIZE_IN_MS))
             current -= _ONE_DAY_MS
+        return buckets
+
+    def _find_newest_nonempty_bucket(self, buckets, what, where):
+        '''return the first bucket in buckets with a record from where
 
-        return None
\ No newline at end of file
+        Rather than paging through every record in each bucket, we probe
+        buckets for the existence of a single record. The probes are issued in
+        windows that double in size (up to LATEST_MAX_PROBE_WINDOW) so that a
+        long lookback with no files costs a handful of rounds of concurrent
+        queries. Within a window we examine the results in order, so the
+        bucket we return is always the newest non-empty one.
+        '''
+        window = self.query_concurrency
+        i = 0
+        while i < len(buckets):
+            probes = buckets[i:i + window]
+            futures = [self._executor.submit(self._bucket_has_records,
+                                             b, what, where)
+                       for b in probes]
+            try:
+                for b, f in zip(probes, futures):
+                    if f.result():
+                        return b
+            finally:
+                # don't bother with probes for older buckets that have not
+                # started yet.
+                for f in futures:
+                    f.cancel()
+            i += window
+            window = min(window * 2, LATEST_MAX_PROBE_WINDOW)
+        return None
+
+    def _bucket_has_records(self, bucket, what, where):
+        kwargs = self._prepare_time_bucket_kwargs(bucket, what, limit=1)
+        self._add_range_key_condition(kwargs, where)
+        response = self._table.query(**kwargs)
+        return len(response['Items']) > 0
@@ -19,6 +19,32 @@ DYNAMODB_TABLE = 'test'
 DYNAMODB_LATEST_TABLE = 'test_latest'
 DATALAKE_USE_LATEST_TABLE = False
 
+# number of time buckets to query in parallel for time-based queries
+DATALAKE_QUERY_CONCURRENCY = 1
+
+# number of file metadata documents to cache in memory
+DATALAKE_METADATA_CACHE_SIZE = 4096
+
+# number of file metadata documents to fetch at once for batch lookups
+DATALAKE_METADATA_CONCURRENCY = 8
+
+# maximum number of file ids in a batch metadata lookup
+DATALAKE_MAX_METADATA_IDS = 1000
+
+# maximum number of what/where pairs in a batch latest lookup
+DATALAKE_MAX_LATEST_PAIRS = 1000
+
+# redirect requests for file data to presigned s3 urls instead of proxying the
+# data through the API. Clients may override this with the redirect parameter.
+DATALAKE_REDIRECT_TO_S3 = False
+
+# number of seconds for which presigned s3 urls are valid
+DATALAKE_PRESIGNED_URL_EXPIRY = 300
+
+# number of seconds after which a streaming listing stops and hands the client
+# a url to stream the rest
+DATALAKE_STREAM_MAX_SECONDS = 300
+
 AWS_REGION = 'us-west-2'
 AWS_ACCESS_KEY_ID = None
 AWS_SECRET_ACCESS_KEY = None
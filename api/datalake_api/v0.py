@@ -15,14 +15,17 @@
 import boto3
 import flask
 from flask import jsonify, Response, url_for
+from werkzeug.http import http_date, quote_etag
 from flask import current_app as app
 import os
 import simplejson as json
 from datetime import datetime, timezone
 import decimal
+import time
 from .querier import ArchiveQuerier, Cursor, InvalidCursor, \
-    DEFAULT_LOOKBACK_DAYS
-from .fetcher import ArchiveFileFetcher
+    DEFAULT_LOOKBACK_DAYS, MAX_RESULTS, get_max_results
+from .fetcher import ArchiveFileFetcher, UnsatisfiableRange
+from uuid import uuid4
 from datalake.common.errors import NoSuchDatalakeFile
 from datalake.common.metadata import Metadata, InvalidDatalakeMetadata
 from .sentry import monitor_performance
@@ -94,10 +97,13 @@ def get_archive_querier():
         table_name = app.config.get('DYNAMODB_TABLE')
         latest_table_name = app.config.get('DYNAMODB_LATEST_TABLE')
         use_latest_table = app.config.get('DATALAKE_USE_LATEST_TABLE')
-        _archive_querier = ArchiveQuerier(table_name,
-                                             latest_table_name,
-                                             use_latest_table,
-                                             dynamodb=get_dynamodb())
+        query_concurrency = app.config.get('DATALAKE_QUERY_CONCURRENCY')
+        _archive_querier = ArchiveQuerier(
+            table_name,
+            latest_table_name,
+            use_latest_table,
+            dynamodb=get_dynamodb(),
+            query_concurrency=query_concurrency)
     return _archive_querier
 
 
@@ -174,9 +180,65 @@ def _validate_files_params(params):
             msg = 'start must be before end'
             flask.abort(400, 'InvalidWorkInterval', msg)
     _validate_cursor(validated)
+    _validate_fields(validated)
+    _validate_limit(validated)
     return validated
 
 
+'''the record fields that may be requested with the fields parameter
+
+Each maps to the record attributes that we need to build it.
+'''
+_RECORD_FIELDS = {
+    'url': ['url'],
+    'http_url': ['metadata.id'],
+    'create_time': ['create_time'],
+    'size': ['size'],
+    'metadata': ['metadata'],
+    'metadata.start_iso': ['metadata.start'],
+    'metadata.end_iso': ['metadata.end'],
+}
+_RECORD_FIELDS.update({
+    'metadata.' + f: ['metadata.' + f]
+    for f in ['version', 'start', 'end', 'where', 'what', 'id', 'hash', 'path',
+              'work_id']
+})
+
+
+def _validate_fields(params):
+    fields = params.get('fields')
+    if fields is None:
+        return
+    fields = [f for f in fields.split(',') if f]
+    unknown = [f for f in fields if f not in _RECORD_FIELDS]
+    if not fields or unknown:
+        msg = 'fields must be a comma-separated list of: {}'
+        msg = msg.format(', '.join(sorted(_RECORD_FIELDS)))
+        flask.abort(400, 'InvalidFields', msg)
+    params['fields'] = fields
+
+
+def _get_attributes(fields):
+    if fields is None:
+        return None
+    return sorted(set(a for f in fields for a in _RECORD_FIELDS[f]))
+
+
+def _validate_limit(params):
+    max_results = get_max_results(_get_attributes(params.get('fields')))
+    if 'limit' not in params:
+        params['limit'] = MAX_RESULTS
+        return
+    try:
+        limit = int(params['limit'])
+    except ValueError:
+        limit = 0
+    if limit < 1 or limit > max_results:
+        msg = 'limit must be an integer between 1 and {} for these fields'
+        flask.abort(400, 'InvalidLimit', msg.format(max_results))
+    params['limit'] = limit
+
+
 def _validate_cursor(params):
     try:
         params['cursor'] = _get_cursor(params)
@@ -209,16 +271,19 @@ def files_get():
 
     If you specify start you must also specify end.
 
-    Returns metadata for at most 100 files. If more files are available, the
-    `next` property in the response will be a url that may be used to retrieve
-    the next page of files.
+    Returns metadata for at most 100 files (or `limit` files). If more files
+    are available, the `next` property in the response will be a url that may
+    be used to retrieve the next page of files.
 
-    Note that no single page will contain duplicate files. However, under some
-    circumstances, requests specifying a start and end time (as opposed to a
-    work_id) may return duplicate records in subsequent pages. So applications
-    that expect to retrieve multiple pages of results should tolerate
-    duplicates. Alternatively, such applications could query for a narrower
-    time interval.
+    Applications that only need some fields of each record should ask for just
+    those with the `fields` parameter. The response is smaller, and larger
+    pages may be requested with `limit`.
+
+    Note that no single page will contain duplicate files, and requests
+    specifying a start and end time never return a file on more than one page.
+    However, under some circumstances, requests specifying a work_id may return
+    duplicate records in subsequent pages. So applications that expect to
+    retrieve multiple pages of work_id results should tolerate duplicates.
 
     ---
     tags:
@@ -252,6 +317,20 @@ def files_get():
               Only return files with data before this end time in ms since
               the epoch.
           type: string
+        - in: query
+          name: fields
+          description:
+              Only return these fields of each record. This is a
+              comma-separated list of top-level fields (e.g., url, http_url,
+              metadata) and metadata fields (e.g., metadata.id).
+          type: string
+        - in: query
+          name: limit
+          description:
+              Return at most this many files per page. The default and maximum
+              is 100. If fields is specified, the maximum may be as high as
+              1000 depending on the fields.
+          type: integer
     responses:
       200:
         description: success
@@ -374,32 +453,153 @@ def files_get():
     params = _validate_files_params(params)
 
     aq = get_archive_querier()
+    results = _query_files(aq, params, params.get('cursor'))
+    response = {
+        'records': _prepare_records(results, params.get('fields')),
+        'next': _get_next_url(flask.request, results),
+    }
+    return Response(json.dumps(response), content_type='application/json')
+
 
-    response = {}
+def _query_files(aq, params, cursor):
     work_id = params.get('work_id')
+    kwargs = dict(where=params.get('where'),
+                  cursor=cursor,
+                  attributes=_get_attributes(params.get('fields')),
+                  limit=params['limit'])
     if work_id is not None:
-        results = aq.query_by_work_id(work_id,
-                                      params.get('what'),
-                                      where=params.get('where'),
-                                      cursor=params.get('cursor'))
-    else:
-        # we are guaranteed by the validate routine that this is a start/end
-        # time-based query.
-        results = aq.query_by_time(params['start'],
-                                   params['end'],
-                                   params['what'],
-                                   where=params.get('where'),
-                                   cursor=params.get('cursor'))
+        return aq.query_by_work_id(work_id, params.get('what'), **kwargs)
 
+    # we are guaranteed by the validate routine that this is a start/end
+    # time-based query.
+    return aq.query_by_time(params['start'],
+                            params['end'],
+                            params['what'],
+                            **kwargs)
+
+
+def _prepare_records(results, fields):
+    if fields is not None:
+        return [_project_record(r, fields) for r in results]
     for r in results:
         r.update(http_url=_get_canonical_http_url(r))
         r['metadata'] = add_utc_metadata(r['metadata'])
+    return results
 
-    response = {
-        'records': results,
-        'next': _get_next_url(flask.request, results),
+
+@v0.route('/archive/files/stream')
+def files_stream():
+    '''Stream files
+
+    Stream metadata for all files subject to query parameters.
+
+    This takes the same parameters as the files endpoint. But instead of
+    returning a page of results, it pages through the results itself and
+    streams them as newline-delimited JSON, one record per line. The last line
+    is a trailer with a `next` property. If the stream ran out of time before
+    all of the results were sent, `next` is a url that streams the rest of the
+    results (and `cursor` is the cursor in that url). Otherwise it is null. A
+    stream without a trailer was cut short and is incomplete.
+    ---
+    tags:
+      - files
+    parameters:
+        - in: query
+          name: what
+          description:
+              Only return files from here.
+          type: string
+          required: true
+        - in: query
+          name: where
+          description:
+              Only return files from here.
+          type: string
+        - in: query
+          name: work_id
+          description:
+              Only return files with this work_id.
+          type: string
+        - in: query
+          name: start
+          description:
+              Only return files with data after this start time in ms since
+              the epoch.
+          type: string
+        - in: query
+          name: end
+          description:
+              Only return files with data before this end time in ms since
+              the epoch.
+          type: string
+        - in: query
+          name: fields
+          description:
+              Only return these fields of each record (see the files
+              endpoint).
+          type: string
+        - in: query
+          name: limit
+          description:
+              The number of records to fetch from the index at a time (see
+              the files endpoint).
+          type: integer
+    responses:
+      200:
+        description: newline-delimited DatalakeRecords and a trailer
+      400:
+        description: bad request
+        schema:
+          id: DatalakeAPIError
+    '''
+    params = flask.request.args
+    params = _validate_files_params(params)
+    aq = get_archive_querier()
+    max_seconds = app.config.get('DATALAKE_STREAM_MAX_SECONDS')
+
+    def _generate():
+        deadline = time.monotonic() + max_seconds
+        cursor = params.get('cursor')
+        while True:
+            results = _query_files(aq, params, cursor)
+            for r in _prepare_records(results, params.get('fields')):
+                yield json.dumps(r) + '\n'
+            cursor = results.cursor
+            if cursor is None or time.monotonic() > deadline:
+                break
+        yield json.dumps(_get_stream_trailer(flask.request, cursor)) + '\n'
+
+    return Response(flask.stream_with_context(_generate()),
+                    content_type='application/x-ndjson')
+
+
+def _get_stream_trailer(request, cursor):
+    if cursor is None:
+        return {'next': None, 'cursor': None}
+    return {
+        'next': _get_url_with_cursor(request, cursor),
+        'cursor': cursor.serialized.decode('ascii'),
     }
-    return Response(json.dumps(response), content_type='application/json')
+
+
+def _project_record(record, fields):
+    projected = {}
+    for f in fields:
+        if f == 'http_url':
+            projected[f] = _get_canonical_http_url(record)
+        elif f == 'metadata':
+            m = add_utc_metadata(record['metadata'])
+            projected.setdefault('metadata', {}).update(m)
+        elif f in ('metadata.start_iso', 'metadata.end_iso'):
+            k = f.split('.')[1]
+            t = record['metadata'].get(k.replace('_iso', ''))
+            projected.setdefault('metadata', {})[k] = unix_ms_to_utc_iso(t)
+        elif f.startswith('metadata.'):
+            k = f.split('.')[1]
+            projected.setdefault('metadata', {})[k] = record['metadata'].get(k)
+        else:
+            projected[f] = record.get(f)
+    return projected
 
 
 def _get_canonical_http_url(record):
@@ -431,14 +631,31 @@ def get_s3_bucket():
 
 def get_archive_fetcher():
     if not hasattr(app, 'archive_fetcher'):
-        app.archive_fetcher = ArchiveFileFetcher(get_s3_bucket())
+        cache_size = app.config.get('DATALAKE_METADATA_CACHE_SIZE')
+        concurrency = app.config.get('DATALAKE_METADATA_CONCURRENCY')
+        app.archive_fetcher = ArchiveFileFetcher(
+            get_s3_bucket(), metadata_cache_size=cache_size,
+            metadata_concurrency=concurrency)
     return app.archive_fetcher
 
 
-def _get_file(file_id):
+def _get_file(file_id, byte_range=None):
     try:
         aff = get_archive_fetcher()
-        return aff.get_file(file_id)
+        return aff.get_file(file_id, byte_range=byte_range)
+    except NoSuchDatalakeFile as e:
+        flask.abort(404, 'NoSuchFile', str(e))
+    except UnsatisfiableRange as e:
+        response = jsonify({'message': str(e), 'code': 'InvalidRange'})
+        response.status_code = 416
+        response.headers['Content-Range'] = 'bytes */{}'.format(e.size)
+        flask.abort(response)
+
+
+def _get_metadata(file_id):
+    try:
+        aff = get_archive_fetcher()
+        return aff.get_metadata(file_id)
     except NoSuchDatalakeFile as e:
         flask.abort(404, 'NoSuchFile', str(e))
 
@@ -451,8 +668,198 @@ def _get_headers_for_file(f):
         headers['Content-Type'] = f.content_type
     if f.content_encoding is not None:
         headers['Content-Encoding'] = f.content_encoding
+    if f.size is not None:
+        headers['Content-Length'] = str(f.size)
+    if f.last_modified is not None:
+        headers['Last-Modified'] = http_date(f.last_modified)
+    headers['Accept-Ranges'] = 'bytes'
+    headers['ETag'] = quote_etag(_get_etag(f.metadata))
     return headers
 
+
+def _get_etag(metadata):
+    # the hash is over the stored content of the file. So it is a fine strong
+    # validator.
+    return metadata['hash']
+
+
+'''the Cache-Control for responses that are unique to a file id
+
+Files (and their metadata) never change once they are in the datalake. So
+clients and caches may hold onto them for as long as they like.
+'''
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def _cache_forever(response):
+    if response.status_code in (200, 206, 304):
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def _is_not_modified(metadata):
+    return flask.request.if_none_match.contains_weak(_get_etag(metadata))
+
+
+def _not_modified(metadata):
+    headers = {'ETag': quote_etag(_get_etag(metadata))}
+    return Response(status=304, headers=headers)
+
+
+def _stream_file(f):
+    headers = _get_headers_for_file(f)
+    return Response(f.iter_content(), 200, headers)
+
+
+def _serve_file(file_id, metadata=None):
+    '''respond with the contents of a file, honoring the request's conditions
+
+    If-None-Match is checked against the file's metadata (which is fetched if
+    not provided) so that the client's copy is confirmed without fetching the
+    content.
+
+    A single range is served from a single ranged s3 GET. Multiple ranges are
+    served as multipart/byteranges with one ranged s3 GET per range. In the
+    latter case, the first range must be satisfiable.
+
+    In redirect mode, the client is instead redirected to a presigned s3 url
+    from which it can fetch the file (or its ranges) directly.
+    '''
+    if 'If-None-Match' in flask.request.headers:
+        metadata = metadata or _get_metadata(file_id)
+        if _is_not_modified(metadata):
+            return _not_modified(metadata)
+
+    if _should_redirect():
+        return _redirect_to_s3(file_id)
+
+    ranges = _get_requested_ranges()
+    if not ranges:
+        return _stream_file(_get_file(file_id))
+
+    f = _get_file(file_id, byte_range=_byte_range_spec(*ranges[0]))
+    if not _if_range_matches(f):
+        f.close()
+        return _stream_file(_get_file(file_id))
+
+    if len(ranges) == 1:
+        return _stream_partial_file(f)
+    return _stream_multipart_file(file_id, f, ranges[1:])
+
+
+def _validate_redirect(redirect):
+    if redirect not in ('0', '1'):
+        msg = 'redirect must be 0 or 1 not {}'.format(redirect)
+        flask.abort(400, 'InvalidRedirect', msg)
+    return redirect == '1'
+
+
+def _should_redirect():
+    redirect = flask.request.args.get('redirect')
+    if redirect is None:
+        return bool(app.config.get('DATALAKE_REDIRECT_TO_S3'))
+    return _validate_redirect(redirect)
+
+
+def _redirect_to_s3(file_id):
+    expires_in = app.config.get('DATALAKE_PRESIGNED_URL_EXPIRY')
+    try:
+        aff = get_archive_fetcher()
+        url = aff.get_presigned_url(file_id, expires_in=expires_in)
+    except NoSuchDatalakeFile as e:
+        flask.abort(404, 'NoSuchFile', str(e))
+    return flask.redirect(url, 302)
+
+
+def _get_requested_ranges():
+    r = flask.request.range
+    if r is None or r.units != 'bytes':
+        return None
+    return r.ranges
+
+
+def _byte_range_spec(begin, end):
+    # NB: werkzeug hands us python-style ranges. That is, end is exclusive,
+    # and a negative begin with no end is a suffix.
+    if begin < 0:
+        return str(begin)
+    if end is None:
+        return '{}-'.format(begin)
+    return '{}-{}'.format(begin, end - 1)
+
+
+def _resolve_range(begin, end, size):
+    '''return the inclusive (first, last) offsets of a range or None'''
+    if begin < 0:
+        begin = max(size + begin, 0)
+    if end is None or end > size:
+        end = size
+    if begin >= end:
+        return None
+    return begin, end - 1
+
+
+def _if_range_matches(f):
+    if 'If-Range' not in flask.request.headers:
+        return True
+    if_range = flask.request.if_range
+    if if_range.etag is not None:
+        # weak validators never match for If-Range
+        weak = flask.request.headers['If-Range'].startswith('W/')
+        return not weak and if_range.etag == _get_etag(f.metadata)
+    if if_range.date is not None and f.last_modified is not None:
+        return if_range.date == f.last_modified.replace(microsecond=0)
+    return False
+
+
+def _get_content_range(first, last, size):
+    return 'bytes {}-{}/{}'.format(first, last, size)
+
+
+def _stream_partial_file(f):
+    first, last = f.content_range
+    headers = _get_headers_for_file(f)
+    headers['Content-Range'] = _get_content_range(first, last, f.size)
+    headers['Content-Length'] = str(last - first + 1)
+    return Response(f.iter_content(), 206, headers)
+
+
+def _stream_multipart_file(file_id, f, ranges):
+    content_type = _get_headers_for_file(f)['Content-Type']
+    size = f.size
+    resolved = [_resolve_range(begin, end, size) for begin, end in ranges]
+    resolved = [r for r in resolved if r is not None]
+    boundary = uuid4().hex
+    # NB: the parts are fetched while the response streams, which is outside
+    # of the app context.
+    aff = get_archive_fetcher()
+
+    def _part_header(first, last):
+        h = '--{}\r\nContent-Type: {}\r\nContent-Range: {}\r\n\r\n'
+        h = h.format(boundary, content_type,
+                     _get_content_range(first, last, size))
+        return h.encode('utf-8')
+
+    def _generate():
+        yield _part_header(*f.content_range)
+        for chunk in f.iter_content():
+            yield chunk
+        yield b'\r\n'
+        for first, last in resolved:
+            part = aff.get_file(file_id, '{}-{}'.format(first, last))
+            yield _part_header(first, last)
+            for chunk in part.iter_content():
+                yield chunk
+            yield b'\r\n'
+        yield '--{}--\r\n'.format(boundary).encode('utf-8')
+
+    headers = {
+        'Content-Type': 'multipart/byteranges; boundary=' + boundary,
+        'Accept-Ranges': 'bytes',
+        'ETag': quote_etag(_get_etag(f.metadata)),
+    }
+    return Response(_generate(), 206, headers)
+
 @monitor_performance()
 def _get_latest(what, where, lookback):
     aq = get_archive_querier()
@@ -469,7 +876,8 @@ def _get_latest(what, where, lookback):
 def file_get_contents(file_id):
     '''Retrieve a file
 
-    Retrieve a file's contents.
+    Retrieve a file's contents. Byte ranges of the file may be requested with
+    the Range header (and made conditional with If-Range).
     ---
     tags:
       - file contents
@@ -480,19 +888,45 @@ def file_get_contents(file_id):
               The id of the file to retrieve
           type: string
           required: true
+        - in: header
+          name: Range
+          description:
+              Only return these byte ranges of the file (e.g., bytes=0-99).
+          type: string
+        - in: query
+          name: redirect
+          description:
+              If 1, redirect to a short-lived s3 url from which the file can
+              be fetched directly. If 0, serve the file from the API. The
+              default is set by the server.
+          type: integer
     responses:
       200:
         description: success
         schema:
           type: file
+      206:
+        description: the requested range(s) of the file
+        schema:
+          type: file
+      302:
+        description: redirect to the file in s3
+      304:
+        description: the file matches the ETag in If-None-Match
+      400:
+        description: bad request
+        schema:
+          id: DatalakeAPIError
       404:
         description: no such file
         schema:
           id: DatalakeAPIError
+      416:
+        description: the requested range is not satisfiable
+        schema:
+          id: DatalakeAPIError
     '''
-    f = _get_file(file_id)
-    headers = _get_headers_for_file(f)
-    return f.read(), 200, headers
+    return _cache_forever(_serve_file(file_id))
 
 
 @v0.route('/archive/files/<file_id>/metadata')
@@ -515,20 +949,78 @@ def file_get_metadata(file_id):
         description: success
         schema:
           id: DatalakeMetadata
+      304:
+        description: the metadata matches the ETag in If-None-Match
       404:
         description: no such file
         schema:
           id: DatalakeAPIError
     '''
-    f = _get_file(file_id)
-    f.metadata = add_utc_metadata(f.metadata)
-    return Response(json.dumps(f.metadata), content_type='application/json')
+    metadata = _get_metadata(file_id)
+    if _is_not_modified(metadata):
+        return _cache_forever(_not_modified(metadata))
+    response = Response(json.dumps(add_utc_metadata(metadata)),
+                        content_type='application/json')
+    response.headers['ETag'] = quote_etag(_get_etag(metadata))
+    return _cache_forever(response)
+
+
+def _validate_metadata_ids(body):
+    ids = body.get('ids') if isinstance(body, dict) else None
+    if not isinstance(ids, list) or not ids or \
+       not all(isinstance(i, str) for i in ids):
+        msg = 'Please provide a JSON object with a non-empty list of "ids"'
+        flask.abort(400, 'InvalidIds', msg)
+    max_ids = app.config.get('DATALAKE_MAX_METADATA_IDS')
+    if len(ids) > max_ids:
+        msg = 'Please provide at most {} ids'.format(max_ids)
+        flask.abort(400, 'TooManyIds', msg)
+    return ids
+
+
+@v0.route('/archive/files/metadata', methods=['POST'])
+def files_post_metadata():
+    '''Retrieve metadata for many files
+
+    Retrieve the metadata for each of a list of file ids.
+    ---
+    tags:
+      - file contents
+    parameters:
+        - in: body
+          name: body
+          description:
+              A JSON object with the list of file ids to look up (at most 1000
+              by default).
+          schema:
+            properties:
+              ids:
+                type: array
+                items:
+                  type: string
+          required: true
+    responses:
+      200:
+        description: success. The metadata property maps each id to its
+                     metadata, or to null if there is no such file.
+      400:
+        description: bad request
+        schema:
+          id: DatalakeAPIError
+    '''
+    body = flask.request.get_json(silent=True)
+    ids = _validate_metadata_ids(body)
+    aff = get_archive_fetcher()
+    metadata = aff.get_metadata_many(ids)
+    metadata = {k: add_utc_metadata(v) for k, v in metadata.items()}
+    return Response(json.dumps({'metadata': metadata}),
+                    content_type='application/json')
 
 
 def _validate_lookback(lookback):
     try:
         return int(lookback)
-    except ValueError:
+    except (ValueError, TypeError):
         msg = 'lookback must be an integer not {}'.format(type(lookback))
         flask.abort(400, 'InvalidLookback', msg)
 
@@ -592,6 +1084,126 @@ def latest_get(what, where):
     return Response(json.dumps(f), content_type='application/json')
 
 
+def _validate_latest_pairs(body):
+    pairs = body.get('pairs') if isinstance(body, dict) else None
+    if not isinstance(pairs, list) or not pairs or \
+       not all(_is_latest_pair(p) for p in pairs):
+        msg = ('Please provide a JSON object with a non-empty list of '
+               '"pairs", each with a "what" and a "where"')
+        flask.abort(400, 'InvalidPairs', msg)
+    max_pairs = app.config.get('DATALAKE_MAX_LATEST_PAIRS')
+    if len(pairs) > max_pairs:
+        msg = 'Please provide at most {} pairs'.format(max_pairs)
+        flask.abort(400, 'TooManyPairs', msg)
+    return [(p['what'], p['where']) for p in pairs]
+
+
+def _is_latest_pair(pair):
+    return isinstance(pair, dict) and \
+        isinstance(pair.get('what'), str) and \
+        isinstance(pair.get('where'), str)
+
+
+@v0.route('/archive/latest/', methods=['POST'])
+def latest_post():
+    '''Retrieve the latest files for many whats and wheres
+
+    Retrieve the latest file for each of a list of what/where pairs. The same
+    lookback rules as for a single latest file apply.
+    ---
+    tags:
+      - latest
+    parameters:
+        - in: body
+          name: body
+          description:
+              A JSON object with the list of pairs to look up (at most 1000
+              by default) and an optional lookback in days.
+          schema:
+            properties:
+              pairs:
+                type: array
+                items:
+                  properties:
+                    what:
+                      type: string
+                    where:
+                      type: string
+              lookback:
+                type: integer
+          required: true
+    responses:
+      200:
+        description: success. The records property lists the latest record
+                     for each pair in order, or null if none was found.
+      400:
+        description: bad request
+        schema:
+          id: DatalakeAPIError
+    '''
+    body = flask.request.get_json(silent=True)
+    pairs = _validate_latest_pairs(body)
+    lookback = _validate_lookback(body.get('lookback', DEFAULT_LOOKBACK_DAYS))
+    aq = get_archive_querier()
+    latest = aq.query_latest_many(pairs, lookback_days=lookback)
+    records = []
+    for pair in pairs:
+        f = latest[pair]
+        if f is not None:
+            f = dict(f, http_url=_get_canonical_http_url(f),
+                     metadata=add_utc_metadata(f['metadata']))
+        records.append(f)
+    return Response(json.dumps({'records': records}),
+                    content_type='application/json')
+
+
+@v0.route('/archive/latest/<what>/')
+def latest_get_all(what):
+    '''Retrieve the latest file for every where of a given what
+
+    Retrieve the latest file from each location that has reported the given
+    what. This reads an index of the latest table, so it is only available
+    when the latest table is in use.
+    ---
+    tags:
+      - latest
+    parameters:
+        - in: path
+          name: what
+          description:
+              The process or program of interest
+          type: string
+          required: true
+        - in: query
+          name: lookback
+          description:
+              The number of days to lookback for latest files that are
+              suspiciously far in the future. The default is 14.
+          type: integer
+    responses:
+      200:
+        description: success. The records property lists the latest record
+                     for each where, sorted by where.
+      400:
+        description: bad request
+        schema:
+          id: DatalakeAPIError
+    '''
+    params = flask.request.args
+    params = _validate_latest_params(params)
+    aq = get_archive_querier()
+    lookback = params.get('lookback', DEFAULT_LOOKBACK_DAYS)
+    records = aq.query_latest_by_what(what, lookback_days=lookback)
+    if records is None:
+        msg = 'The latest file for every where requires the latest table'
+        flask.abort(400, 'NoLatestTable', msg)
+    for f in records:
+        f.update(http_url=_get_canonical_http_url(f))
+        f['metadata'] = add_utc_metadata(f['metadata'])
+    return Response(json.dumps({'records': records}),
+                    content_type='application/json')
+
+
 @v0.route('/archive/latest/<what>/<where>/data')
 def latest_get_contents(what, where):
     '''Retrieve the latest file data for a given what and where
@@ -623,11 +1235,20 @@ def latest_get_contents(what, where):
               The number of days to lookback for the latest file. The default
               is 14.
           type: integer
+        - in: query
+          name: redirect
+          description:
+              If 1, redirect to a short-lived s3 url from which the file can
+              be fetched directly. If 0, serve the file from the API. The
+              default is set by the server.
+          type: integer
     responses:
       200:
         description: success
         schema:
           type: file
+      302:
+        description: redirect to the file in s3
       404:
         description: no latest file found for the given what or where in the
                      last 14 days.
@@ -638,9 +1259,7 @@ def latest_get_contents(what, where):
     params = flask.request.args
     params = _validate_latest_params(params)
     f = _get_latest(what, where, params.get('lookback', DEFAULT_LOOKBACK_DAYS))
-    f = _get_file(f['metadata']['id'])
-    headers = _get_headers_for_file(f)
-    return f.read(), 200, headers
+    return _serve_file(f['metadata']['id'], metadata=f['metadata'])
 
 
 def get_build_version():
@@ -111,6 +111,14 @@ latest_attribute_definitions = [
     {
         'AttributeName': 'what_where_key',
         'AttributeType': 'S'
+    },
+    {
+        'AttributeName': 'what_key',
+        'AttributeType': 'S'
+    },
+    {
+        'AttributeName': 'where_key',
+        'AttributeType': 'S'
     }
 ]
 
@@ -142,6 +150,27 @@ global_secondary = [{
     }
 }]
 
+latest_global_secondary = [{
+    'IndexName': 'what-index',
+    'KeySchema': [
+        {
+            'AttributeName': 'what_key',
+            'KeyType': 'HASH'
+        },
+        {
+            'AttributeName': 'where_key',
+            'KeyType': 'RANGE'
+        }
+    ],
+    'Projection': {
+        'ProjectionType': 'ALL'
+    },
+    'ProvisionedThroughput': {
+        'ReadCapacityUnits': 5,
+        'WriteCapacityUnits': 5,
+    }
+}]
+
 
 def _delete_table(table):
     try:
@@ -190,7 +219,7 @@ def table_maker(request, dynamodb):
         latest_table_name = 'test_latest'
 
         table = _create_table(dynamodb, table_name, attribute_definitions, key_schema, global_secondary)
-        latest_table = _create_table(dynamodb, latest_table_name, latest_attribute_definitions, latest_key_schema)
+        latest_table = _create_table(dynamodb, latest_table_name, latest_attribute_definitions, latest_key_schema, latest_global_secondary)
 
         _populate_table(latest_table, records)
         _populate_table(table, records)
@@ -220,6 +249,8 @@ def record_maker(s3_file_from_metadata):
         where = kwargs.get('where')
         for record in records:
             record['what_where_key'] = f"{what}:{where}"
+            record['what_key'] = m['what']
+            record['where_key'] = m['where']
 
         return records
 
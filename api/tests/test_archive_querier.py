@@ -20,7 +20,8 @@ from datalake.tests import generate_random_metadata
 import simplejson as json
 from urllib.parse import urlparse
 import time
-from datalake_api.querier import ArchiveQuerier, MAX_RESULTS
+from datalake_api.querier import ArchiveQuerier, MAX_RESULTS, \
+    MAX_PROJECTED_RESULTS, get_max_results
 from conftest import get_client, YEAR_2010
 
 
@@ -328,9 +329,9 @@ def test_paginate_work_id_records(table_maker, querier, record_maker):
 
 
 def evaluate_time_based_results(results, num_expected):
-    # we tolerate some duplication for time queries because there is no great
-    # way to deduplicate across pages.
-    assert len(results) >= num_expected
+    # records are only returned from their home bucket. So there should be no
+    # duplication across pages.
+    assert len(results) == num_expected
     ids = set([r['metadata']['id'] for r in results])
     assert len(ids) == num_expected
 
@@ -428,6 +429,27 @@ def test_null_end(table_maker, querier, record_maker):
     assert len(results) == 1
 
 
+def test_no_duplicates_across_pages(table_maker, querier, record_maker):
+    # many records that span several buckets each, and several pages' worth
+    # of records starting in each bucket.
+    records = []
+    interval = DatalakeRecord.TIME_BUCKET_SIZE_IN_MS
+    very_end = YEAR_2010 + 5 * interval
+    for start in range(YEAR_2010, very_end, interval):
+        for i in range(60):
+            records += record_maker(start=start + i, end=start + 3 * interval,
+                                    what='foo', where='w{}'.format(i % 7))
+    table_maker(records)
+    query_start = YEAR_2010 + interval + 1
+    pages = get_all_pages(querier.query_by_time,
+                          [query_start, very_end, 'foo'])
+    assert len(pages) > 1
+    results = consolidate_pages(pages)
+    ids = [r['metadata']['id'] for r in results]
+    assert len(ids) == len(set(ids))
+    assert len(ids) == 5 * 60
+
+
 def test_no_end(table_maker, querier, s3_file_from_metadata):
     m = generate_random_metadata()
     del(m['end'])
@@ -613,3 +635,395 @@ def test_query_latest_future_record_exceeds_lookforward(table_maker, querier, re
     result = querier.query_latest('meow', 'tree')
     assert result is None, "No result should be returned if falling back to the default query"
 
+
+
+def _page_ids(pages):
+    return [[r['metadata']['id'] for r in p] for p in pages]
+
+
+@pytest.mark.parametrize('query_concurrency', [2, 7])
+def test_concurrent_time_query_matches_serial(table_maker, record_maker,
+                                              dynamodb, query_concurrency):
+    records = []
+    interval = DatalakeRecord.TIME_BUCKET_SIZE_IN_MS
+    very_end = YEAR_2010 + 20 * interval
+    for start in range(YEAR_2010, very_end, interval):
+        # a sparse bucket, a few records that span two buckets, and a dense
+        # bucket or two that force a page break mid-bucket.
+        n = 70 if start == YEAR_2010 + 5 * interval else 3
+        for i in range(n):
+            records += record_maker(start=start, end=start + interval,
+                                    what='foo', where='w{}'.format(i))
+    table_maker(records)
+
+    serial = ArchiveQuerier('test', dynamodb=dynamodb)
+    concurrent = ArchiveQuerier('test', dynamodb=dynamodb,
+                                query_concurrency=query_concurrency)
+    args = [YEAR_2010, very_end, 'foo']
+    serial_pages = get_all_pages(serial.query_by_time, args)
+    concurrent_pages = get_all_pages(concurrent.query_by_time, args)
+    assert len(serial_pages) > 1
+    assert _page_ids(concurrent_pages) == _page_ids(serial_pages)
+    assert [p.cursor for p in concurrent_pages] == \
+        [p.cursor for p in serial_pages]
+
+
+def test_concurrent_time_query_with_where(table_maker, record_maker,
+                                          dynamodb):
+    records = []
+    for i in range(4):
+        records += record_maker(start=YEAR_2010, end=YEAR_2010 + 10,
+                                what='foo', where='worker{}'.format(i))
+    table_maker(records)
+    querier = ArchiveQuerier('test', dynamodb=dynamodb, query_concurrency=4)
+    results = querier.query_by_time(YEAR_2010, YEAR_2010 + 10, 'foo',
+                                    where='worker2')
+    assert len(results) == 1
+    assert all_results(results, where='worker2')
+
+
+@pytest.mark.parametrize('query_concurrency', [1, 3])
+def test_default_latest_probes_back(table_maker, record_maker, dynamodb,
+                                    query_concurrency):
+    now = int(time.time() * 1000)
+    records = []
+    for days_ago in [9, 10]:
+        records += record_maker(start=now - days_ago * _ONE_DAY_MS, end=None,
+                                what='tower', where='pisa')
+    records += record_maker(start=now - 2 * _ONE_DAY_MS, end=None,
+                            what='tower', where='babel')
+    table_maker(records)
+    querier = ArchiveQuerier('test', dynamodb=dynamodb,
+                             query_concurrency=query_concurrency)
+    result = querier.query_latest('tower', 'pisa')
+    _validate_latest_result(result, what='tower', where='pisa',
+                            start=now - 9 * _ONE_DAY_MS)
+    assert querier.query_latest('tower', 'pisa', lookback_days=8) is None
+
+
+def test_get_max_results():
+    assert get_max_results() == MAX_RESULTS
+    assert get_max_results(['metadata']) == MAX_RESULTS
+    assert get_max_results(['url', 'metadata.id']) == MAX_PROJECTED_RESULTS
+    assert MAX_RESULTS < get_max_results(['metadata.' + str(i)
+                                          for i in range(20)]) \
+        < MAX_PROJECTED_RESULTS
+
+
+def test_projected_time_query(table_maker, record_maker, dynamodb):
+    records = record_maker(start=YEAR_2010, end=YEAR_2010 + 10, what='foo',
+                           where='here')
+    table_maker(records)
+    querier = ArchiveQuerier('test', dynamodb=dynamodb)
+    results = querier.query_by_time(YEAR_2010, YEAR_2010 + 10, 'foo',
+                                    attributes=['url', 'metadata.where'])
+    assert len(results) == 1
+    assert results[0]['url'] == records[0]['url']
+    assert set(results[0]['metadata']) == set(['id', 'where', 'start', 'end'])
+    assert results[0]['metadata']['where'] == 'here'
+
+
+def test_projected_work_id_query(table_maker, record_maker, dynamodb):
+    records = record_maker(start=YEAR_2010, end=YEAR_2010 + 10, what='foo',
+                           work_id='job0')
+    table_maker(records)
+    querier = ArchiveQuerier('test', dynamodb=dynamodb)
+    results = querier.query_by_work_id('job0', 'foo', attributes=['metadata'])
+    assert len(results) == 1
+    assert 'url' not in results[0]
+    assert results[0]['metadata'] == records[0]['metadata']
+
+
+def _get_all_limited_pages(query_function, query_args, **kwargs):
+    pages = []
+    cursor = None
+    while True:
+        page = query_function(*query_args, cursor=cursor, **kwargs)
+        assert len(page) <= kwargs['limit']
+        pages.append(page)
+        cursor = page.cursor
+        if cursor is None:
+            break
+    return pages
+
+
+@pytest.mark.parametrize('query_concurrency', [1, 3])
+def test_time_query_limit(table_maker, record_maker, dynamodb,
+                          query_concurrency):
+    records = []
+    interval = DatalakeRecord.TIME_BUCKET_SIZE_IN_MS
+    very_end = YEAR_2010 + 5 * interval
+    for start in range(YEAR_2010, very_end, interval):
+        for i in range(50):
+            records += record_maker(start=start + i, end=start + i,
+                                    what='foo')
+    table_maker(records)
+    querier = ArchiveQuerier('test', dynamodb=dynamodb,
+                             query_concurrency=query_concurrency)
+    pages = _get_all_limited_pages(querier.query_by_time,
+                                   [YEAR_2010, very_end, 'foo'],
+                                   attributes=['metadata.id'], limit=225)
+    assert [len(p) for p in pages] == [225, 25]
+    evaluate_time_based_results(consolidate_pages(pages), 250)
+
+
+@pytest.mark.skipif(moto_major < 3, reason='moto: issue 3909')
+def test_work_id_query_limit(table_maker, record_maker, dynamodb):
+    records = []
+    for i in range(25):
+        records += record_maker(what='foo', work_id='job0',
+                                start=YEAR_2010, end=YEAR_2010 + 10)
+    table_maker(records)
+    querier = ArchiveQuerier('test', dynamodb=dynamodb)
+    pages = _get_all_limited_pages(querier.query_by_work_id, ['job0', 'foo'],
+                                   limit=10)
+    assert len(consolidate_pages(pages)) == 25
+    assert all(len(p) <= 10 for p in pages)
+
+
+def test_http_fields_and_limit(table_maker, record_maker, dynamodb):
+    records = []
+    for i in range(150):
+        records += record_maker(start=YEAR_2010 + i, end=YEAR_2010 + i,
+                                what='foo')
+    table_maker(records)
+    client = get_client()
+    uri = '/v0/archive/files/?what=foo&start={}&end={}'
+    uri = uri.format(YEAR_2010, YEAR_2010 + 150)
+    res = client.get(uri + '&fields=url,http_url,metadata.start_iso&limit=200')
+    assert res.status_code == 200
+    response = json.loads(res.get_data())
+    assert response['next'] is None
+    assert len(response['records']) == 150
+    for r in response['records']:
+        assert set(r) == set(['url', 'http_url', 'metadata'])
+        assert set(r['metadata']) == set(['start_iso'])
+        assert r['http_url'].endswith('/data')
+
+    res = client.get(uri + '&fields=metadata.id&limit=100')
+    response = json.loads(res.get_data())
+    assert len(response['records']) == 100
+    assert 'fields=metadata.id' in response['next']
+    assert 'limit=100' in response['next']
+
+
+def _get_stream(client, uri):
+    res = client.get(uri)
+    assert res.status_code == 200
+    assert res.is_streamed
+    assert res.mimetype == 'application/x-ndjson'
+    lines = [json.loads(l) for l in res.get_data().splitlines()]
+    return lines[:-1], lines[-1]
+
+
+def test_stream_time_records(table_maker, record_maker, dynamodb):
+    records = []
+    interval = DatalakeRecord.TIME_BUCKET_SIZE_IN_MS
+    very_end = YEAR_2010 + 3 * interval
+    for start in range(YEAR_2010, very_end, interval):
+        for i in range(70):
+            records += record_maker(start=start + i, end=start + interval,
+                                    what='foo')
+    table_maker(records)
+    client = get_client()
+    uri = '/v0/archive/files/stream?what=foo&start={}&end={}'
+    uri = uri.format(YEAR_2010, very_end)
+    streamed, trailer = _get_stream(client, uri)
+    assert trailer == {'next': None, 'cursor': None}
+    evaluate_time_based_results(streamed, 210)
+    for r in streamed:
+        HttpRecord(**r)
+        assert 'start_iso' in r['metadata']
+
+    paged = get_all_pages(HttpQuerier().query_by_time,
+                          [YEAR_2010, very_end, 'foo'])
+    assert streamed == consolidate_pages(paged)
+
+
+def test_stream_resumes_after_deadline(table_maker, record_maker, dynamodb):
+    records = []
+    for i in range(25):
+        records += record_maker(what='foo', work_id='job0',
+                                start=YEAR_2010, end=YEAR_2010 + 10)
+    table_maker(records)
+    client = get_client()
+    client.application.config['DATALAKE_STREAM_MAX_SECONDS'] = 0
+    uri = '/v0/archive/files/stream?what=foo&work_id=job0&limit=10'
+    uri += '&fields=metadata.id'
+    streamed = []
+    while uri is not None:
+        lines, trailer = _get_stream(client, uri)
+        assert len(lines) <= 10
+        streamed += lines
+        uri = trailer['next']
+        if uri is not None:
+            assert trailer['cursor'] and 'cursor=' in uri
+            assert '/v0/archive/files/stream?' in uri
+            uri = '/'.join([''] + uri.split('/')[3:])
+    assert len(set(r['metadata']['id'] for r in streamed)) == 25
+    assert all(set(r) == set(['metadata']) for r in streamed)
+
+
+def test_stream_bad_query(client):
+    res = client.get('/v0/archive/files/stream?what=foo')
+    assert res.status_code == 400
+    assert json.loads(res.get_data())['code'] == 'NoWorkInterval'
+
+
+def _make_latest_pairs(record_maker, n, now):
+    records = []
+    for i in range(n):
+        records += record_maker(start=now - i, end=None, what='foo',
+                                where='w{}'.format(i))
+    return records
+
+
+@pytest.mark.parametrize('use_latest_table', [True, False])
+def test_query_latest_many(table_maker, record_maker, dynamodb,
+                           use_latest_table):
+    now = int(time.time() * 1000)
+    records = _make_latest_pairs(record_maker, 120, now)
+    table_maker(records)
+    querier = ArchiveQuerier('test', 'test_latest',
+                             use_latest_table=use_latest_table,
+                             dynamodb=dynamodb)
+    pairs = [('foo', 'w{}'.format(i)) for i in range(120)]
+    pairs += [('foo', 'nope'), ('foo', 'w0')]
+    results = querier.query_latest_many(pairs)
+    assert len(results) == 121
+    assert results[('foo', 'nope')] is None
+    for i in range(120):
+        _validate_latest_result(results[('foo', 'w{}'.format(i))],
+                                what='foo', where='w{}'.format(i),
+                                start=now - i)
+
+
+class _ThrottlingDynamoDB(object):
+    '''a dynamodb resource that leaves keys unprocessed a few times'''
+
+    def __init__(self, dynamodb, throttles):
+        self._dynamodb = dynamodb
+        self.throttles = throttles
+        self.batch_sizes = []
+
+    def __getattr__(self, name):
+        return getattr(self._dynamodb, name)
+
+    def batch_get_item(self, RequestItems):
+        (name, request), = RequestItems.items()
+        self.batch_sizes.append(len(request['Keys']))
+        if self.throttles == 0:
+            return self._dynamodb.batch_get_item(RequestItems=RequestItems)
+        self.throttles -= 1
+        keys = request['Keys']
+        processed = {name: dict(request, Keys=keys[:1])}
+        response = self._dynamodb.batch_get_item(RequestItems=processed)
+        response['UnprocessedKeys'] = {name: dict(request, Keys=keys[1:])}
+        return response
+
+
+def test_query_latest_many_retries_unprocessed(table_maker, record_maker,
+                                               dynamodb):
+    now = int(time.time() * 1000)
+    table_maker(_make_latest_pairs(record_maker, 3, now))
+    throttling = _ThrottlingDynamoDB(dynamodb, throttles=2)
+    querier = ArchiveQuerier('test', 'test_latest', use_latest_table=True,
+                             dynamodb=throttling)
+    pairs = [('foo', 'w{}'.format(i)) for i in range(3)]
+    results = querier.query_latest_many(pairs)
+    assert throttling.batch_sizes == [3, 2, 1]
+    assert all(results[p]['metadata']['where'] == p[1] for p in pairs)
+
+
+def test_http_latest_many(table_maker, record_maker, dynamodb):
+    now = int(time.time() * 1000)
+    table_maker(_make_latest_pairs(record_maker, 3, now))
+    client = get_client()
+    pairs = [{'what': 'foo', 'where': w} for w in ['w2', 'nope', 'w0']]
+    res = client.post('/v0/archive/latest/', json={'pairs': pairs})
+    assert res.status_code == 200
+    records = json.loads(res.get_data())['records']
+    assert records[1] is None
+    for r, where in [(records[0], 'w2'), (records[2], 'w0')]:
+        HttpRecord(**r)
+        assert r['metadata']['where'] == where
+        assert 'start_iso' in r['metadata']
+
+
+@pytest.mark.parametrize('body', [
+    None,
+    {'pairs': []},
+    {'pairs': [{'what': 'foo'}]},
+    {'pairs': ['foo:bar']},
+])
+def test_http_latest_many_bad_pairs(client, body):
+    res = client.post('/v0/archive/latest/', json=body)
+    assert res.status_code == 400
+    assert json.loads(res.get_data())['code'] == 'InvalidPairs'
+
+
+def test_http_latest_many_bad_lookback(client):
+    body = {'pairs': [{'what': 'foo', 'where': 'bar'}], 'lookback': 'nine'}
+    res = client.post('/v0/archive/latest/', json=body)
+    assert res.status_code == 400
+    assert json.loads(res.get_data())['code'] == 'InvalidLookback'
+
+
+def test_query_latest_by_what(table_maker, record_maker, dynamodb):
+    now = int(time.time() * 1000)
+    records = _make_latest_pairs(record_maker, 3, now)
+    records += record_maker(start=now, end=None, what='bar', where='w0')
+    table_maker(records)
+    querier = ArchiveQuerier('test', 'test_latest', use_latest_table=True,
+                             dynamodb=dynamodb)
+    results = querier.query_latest_by_what('foo')
+    assert [r['metadata']['where'] for r in results] == ['w0', 'w1', 'w2']
+    for i, r in enumerate(results):
+        _validate_latest_result(r, what='foo', start=now - i)
+
+
+def test_query_latest_by_what_without_latest_table(table_maker, dynamodb):
+    table_maker([])
+    querier = ArchiveQuerier('test', 'test_latest', use_latest_table=False,
+                             dynamodb=dynamodb)
+    assert querier.query_latest_by_what('foo') is None
+
+
+def test_query_latest_by_what_beyond_lookforward(table_maker, record_maker,
+                                                 dynamodb):
+    now = int(time.time() * 1000)
+    future = now + 25 * 60 * 60 * 1000
+    default_table, latest_table = table_maker(
+        record_maker(start=now, end=None, what='foo', where='w0'))
+    for record in record_maker(start=future, end=None, what='foo',
+                               where='w1'):
+        latest_table.put_item(Item=record)
+    querier = ArchiveQuerier('test', 'test_latest', use_latest_table=True,
+                             dynamodb=dynamodb)
+    results = querier.query_latest_by_what('foo')
+    assert [r['metadata']['where'] for r in results] == ['w0']
+
+
+def test_http_latest_by_what(table_maker, record_maker, dynamodb):
+    now = int(time.time() * 1000)
+    table_maker(_make_latest_pairs(record_maker, 2, now))
+    client = get_client()
+    client.application.config['DATALAKE_USE_LATEST_TABLE'] = True
+    reset_archive_querier()
+    res = client.get('/v0/archive/latest/foo/')
+    assert res.status_code == 200
+    records = json.loads(res.get_data())['records']
+    assert [r['metadata']['where'] for r in records] == ['w0', 'w1']
+    for r in records:
+        HttpRecord(**r)
+        assert 'start_iso' in r['metadata']
+
+
+def test_http_latest_by_what_without_latest_table(table_maker, dynamodb):
+    table_maker([])
+    client = get_client()
+    client.application.config['DATALAKE_USE_LATEST_TABLE'] = False
+    reset_archive_querier()
+    res = client.get('/v0/archive/latest/foo/')
+    assert res.status_code == 400
+    assert json.loads(res.get_data())['code'] == 'NoLatestTable'
@@ -133,3 +133,45 @@ def test_bad_cursor_valid_json(client):
     }
     res = get_bad_request(client, params)
     assert res['code'] == 'InvalidCursor'
+
+
+def test_invalid_fields(client):
+    params = {
+        'what': 'syslog',
+        'work_id': 'work123',
+        'fields': 'url,nosuchfield',
+    }
+    res = get_bad_request(client, params)
+    assert res['code'] == 'InvalidFields'
+
+
+def test_empty_fields(client):
+    params = {
+        'what': 'syslog',
+        'work_id': 'work123',
+        'fields': ',',
+    }
+    res = get_bad_request(client, params)
+    assert res['code'] == 'InvalidFields'
+
+
+def test_invalid_limit(client):
+    for limit in ['0', '-1', 'ten', '101']:
+        params = {
+            'what': 'syslog',
+            'work_id': 'work123',
+            'limit': limit,
+        }
+        res = get_bad_request(client, params)
+        assert res['code'] == 'InvalidLimit'
+
+
+def test_limit_too_large_for_fields(client):
+    params = {
+        'what': 'syslog',
+        'work_id': 'work123',
+        'fields': 'url',
+        'limit': '1001',
+    }
+    res = get_bad_request(client, params)
+    assert res['code'] == 'InvalidLimit'
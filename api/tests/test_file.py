@@ -17,7 +17,7 @@ from io import BytesIO
 import simplejson as json
 from datalake_api.fetcher import ArchiveFile
 import time
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urlparse, parse_qs
 from datalake.common import DatalakeRecord
 
 
@@ -36,6 +36,7 @@ def _validate_file_result(result, content, content_type='text/plain',
     assert result.status_code == 200
     assert result.content_type == content_type
     assert result.content_encoding == content_encoding
+    assert result.content_length == len(content)
     assert result.get_data() == content
 
 
@@ -170,6 +171,225 @@ def test_archive_file_bigger_than_header(tmpfile, random_metadata):
     assert af.read() == ''
 
 
+def test_archive_file_iter_content(tmpfile, random_metadata):
+    content = 'x' * 1024 + 'y' * 1000
+    f = open(tmpfile(content))
+    af = ArchiveFile(f, random_metadata)
+    chunks = list(af.iter_content(chunk_size=300))
+    assert chunks[0] == 'x' * 1024
+    assert all(len(c) <= 300 for c in chunks[1:])
+    assert ''.join(chunks) == content
+    assert list(af.iter_content()) == []
+    assert f.closed
+
+
+def test_get_large_file_in_chunks(file_getter, s3_file_maker,
+                                  random_metadata):
+    random_metadata['path'] = '/home/you/big.txt'
+    random_metadata['id'] = '12345'
+    content = b'0123456789abcdef' * 20000
+    s3_file_maker('datalake-test', '12345/data', content, random_metadata)
+    res = file_getter('12345')
+    assert res.is_streamed
+    _validate_file_result(res, content)
+
+
+@pytest.fixture
+def range_getter(client):
+
+    def getter(file_id, byte_range, **headers):
+        uri = '/v0/archive/files/' + file_id + '/data'
+        headers['Range'] = byte_range
+        return client.get(uri, headers=headers)
+
+    return getter
+
+
+@pytest.fixture
+def range_file(s3_file_maker, random_metadata):
+    random_metadata['path'] = '/home/you/foo.txt'
+    random_metadata['id'] = '12345'
+    content = b'once upon a time'
+    s3_file_maker('datalake-test', '12345/data', content, random_metadata)
+    return content
+
+
+@pytest.mark.parametrize('byte_range,first,last', [
+    ('bytes=0-3', 0, 3),
+    ('bytes=5-8', 5, 8),
+    ('bytes=10-', 10, 15),
+    ('bytes=-4', 12, 15),
+    ('bytes=12-100', 12, 15),
+])
+def test_get_byte_range(range_getter, range_file, byte_range, first, last):
+    res = range_getter('12345', byte_range)
+    assert res.status_code == 206
+    assert res.content_type == 'text/plain'
+    assert res.headers['Content-Range'] == 'bytes {}-{}/16'.format(first,
+                                                                  last)
+    assert res.content_length == last - first + 1
+    assert res.get_data() == range_file[first:last + 1]
+
+
+def test_get_multiple_byte_ranges(range_getter, range_file):
+    res = range_getter('12345', 'bytes=0-3,10-11,20-30')
+    assert res.status_code == 206
+    assert res.mimetype == 'multipart/byteranges'
+    boundary = res.mimetype_params['boundary'].encode('utf-8')
+    parts = res.get_data().split(b'--' + boundary)
+    assert parts[0] == b''
+    assert parts[-1] == b'--\r\n'
+    parts = [p.split(b'\r\n\r\n', 1) for p in parts[1:-1]]
+    assert len(parts) == 2
+    assert b'Content-Range: bytes 0-3/16' in parts[0][0]
+    assert parts[0][1] == b'once\r\n'
+    assert b'Content-Range: bytes 10-11/16' in parts[1][0]
+    assert parts[1][1] == b'a \r\n'
+
+
+def test_get_unsatisfiable_byte_range(range_getter, range_file):
+    res = range_getter('12345', 'bytes=100-200')
+    assert res.status_code == 416
+    assert res.headers['Content-Range'] == 'bytes */16'
+    assert res.json['code'] == 'InvalidRange'
+
+
+def test_get_byte_range_of_missing_file(range_getter, s3_bucket_maker):
+    s3_bucket_maker('datalake-test')
+    res = range_getter('12345', 'bytes=0-3')
+    assert res.status_code == 404
+    assert res.json['code'] == 'NoSuchFile'
+
+
+def test_ignore_invalid_byte_range(range_getter, range_file):
+    res = range_getter('12345', 'bytes=3-1')
+    _validate_file_result(res, range_file)
+    assert res.headers['Accept-Ranges'] == 'bytes'
+
+
+@pytest.mark.parametrize('if_range,status_code', [
+    ('"wrong"', 200),
+    ('W/"{hash}"', 200),
+    ('"{hash}"', 206),
+])
+def test_get_byte_range_if_range_etag(range_getter, range_file,
+                                      random_metadata, if_range, status_code):
+    if_range = if_range.format(hash=random_metadata['hash'])
+    res = range_getter('12345', 'bytes=0-3', **{'If-Range': if_range})
+    assert res.status_code == status_code
+
+
+def test_get_byte_range_if_range_date(range_getter, file_getter, range_file):
+    last_modified = file_getter('12345').headers['Last-Modified']
+    res = range_getter('12345', 'bytes=0-3', **{'If-Range': last_modified})
+    assert res.status_code == 206
+    stale = 'Thu, 01 Jan 1970 00:00:00 GMT'
+    res = range_getter('12345', 'bytes=0-3', **{'If-Range': stale})
+    assert res.status_code == 200
+    assert res.get_data() == range_file
+
+
+def test_get_gzipped_byte_range(range_getter, s3_file_maker,
+                                random_metadata):
+    random_metadata['path'] = '/home/you/foo.txt.gz'
+    random_metadata['id'] = '12345'
+    content = create_gzip_string(b'no place like home')
+    s3_file_maker('datalake-test', '12345/data', content, random_metadata)
+    res = range_getter('12345', 'bytes=5-')
+    assert res.status_code == 206
+    assert res.content_encoding == 'gzip'
+    assert res.get_data() == content[5:]
+
+
+def test_get_file_etag(file_getter, range_file, random_metadata):
+    res = file_getter('12345')
+    assert res.headers['ETag'] == '"{}"'.format(random_metadata['hash'])
+    assert 'immutable' in res.headers['Cache-Control']
+
+
+def test_get_file_not_modified(client, file_getter, range_file, s3_connection,
+                               random_metadata):
+    etag = file_getter('12345').headers['ETag']
+
+    # the client's copy is confirmed without going back to the s3 object
+    s3_connection.Object('datalake-test', '12345/data').delete()
+    for if_none_match in [etag, 'W/' + etag, '"other", ' + etag, '*']:
+        headers = {'If-None-Match': if_none_match}
+        res = client.get('/v0/archive/files/12345/data', headers=headers)
+        assert res.status_code == 304
+        assert res.headers['ETag'] == etag
+        assert 'immutable' in res.headers['Cache-Control']
+        assert res.get_data() == b''
+
+
+def test_get_file_modified(client, range_file):
+    headers = {'If-None-Match': '"other"'}
+    res = client.get('/v0/archive/files/12345/data', headers=headers)
+    _validate_file_result(res, range_file)
+
+
+def test_get_byte_range_etag(range_getter, range_file, random_metadata):
+    res = range_getter('12345', 'bytes=0-3')
+    assert res.status_code == 206
+    assert res.headers['ETag'] == '"{}"'.format(random_metadata['hash'])
+    res = range_getter('12345', 'bytes=0-3,5-6')
+    assert res.status_code == 206
+    assert res.headers['ETag'] == '"{}"'.format(random_metadata['hash'])
+
+
+def _get_redirect_params(res):
+    assert res.status_code == 302
+    url = urlparse(res.headers['Location'])
+    return url, parse_qs(url.query)
+
+
+def test_redirect_to_s3(client, range_file):
+    res = client.get('/v0/archive/files/12345/data?redirect=1')
+    url, params = _get_redirect_params(res)
+    assert url.path.endswith('/12345/data')
+    assert params['response-content-type'] == ['text/plain']
+    assert 'response-content-encoding' not in params
+    assert any('Signature' in k for k in params)
+
+
+def test_redirect_gzipped_file_to_s3(client, s3_file_maker, random_metadata):
+    random_metadata['path'] = '/home/you/foo.txt.gz'
+    random_metadata['id'] = '12345'
+    content = create_gzip_string(b'no place like home')
+    s3_file_maker('datalake-test', '12345/data', content, random_metadata)
+    res = client.get('/v0/archive/files/12345/data?redirect=1')
+    url, params = _get_redirect_params(res)
+    assert params['response-content-encoding'] == ['gzip']
+
+
+def test_redirect_empty_file_to_s3(client, s3_file_maker, random_metadata):
+    random_metadata['id'] = '12345'
+    s3_file_maker('datalake-test', '12345/data', b'', random_metadata)
+    res = client.get('/v0/archive/files/12345/data?redirect=1')
+    _get_redirect_params(res)
+
+
+def test_redirect_by_default(client, file_getter, range_file):
+    client.application.config['DATALAKE_REDIRECT_TO_S3'] = True
+    res = file_getter('12345')
+    _get_redirect_params(res)
+    res = client.get('/v0/archive/files/12345/data?redirect=0')
+    _validate_file_result(res, range_file)
+
+
+def test_redirect_no_such_file(client, s3_bucket_maker):
+    s3_bucket_maker('datalake-test')
+    res = client.get('/v0/archive/files/12345/data?redirect=1')
+    assert res.status_code == 404
+    assert res.json['code'] == 'NoSuchFile'
+
+
+def test_invalid_redirect(client, range_file):
+    res = client.get('/v0/archive/files/12345/data?redirect=yes')
+    assert res.status_code == 400
+    assert res.json['code'] == 'InvalidRedirect'
+
+
 @pytest.fixture
 def latest_getter(client):
 
@@ -228,6 +448,36 @@ def test_latest_gzipped_text_file(record_maker, latest_getter,
     _validate_file_result(res, content, content_encoding='gzip')
 
 
+def test_redirect_latest_to_s3(record_maker, latest_getter, random_metadata):
+    now = int(time.time() * 1000)
+    random_metadata['path'] = '/home/you/foo.json'
+    random_metadata['id'] = '12345'
+    random_metadata['what'] = 'json'
+    random_metadata['where'] = 'here'
+    random_metadata['start'] = now
+    random_metadata['end'] = None
+    record_maker(b'{}', random_metadata)
+    res = latest_getter('json', 'here', redirect=1)
+    url, params = _get_redirect_params(res)
+    assert url.path.endswith('/12345/data')
+    assert params['response-content-type'] == ['application/json']
+
+
+def test_latest_not_modified(record_maker, client, random_metadata):
+    now = int(time.time() * 1000)
+    random_metadata['id'] = '12345'
+    random_metadata['what'] = 'text'
+    random_metadata['where'] = 'there'
+    random_metadata['start'] = now
+    random_metadata['end'] = None
+    record_maker(b'once upon a time', random_metadata)
+    headers = {'If-None-Match': '"{}"'.format(random_metadata['hash'])}
+    res = client.get('/v0/archive/latest/text/there/data', headers=headers)
+    assert res.status_code == 304
+    # the latest file may change
+    assert 'Cache-Control' not in res.headers
+
+
 def test_no_such_where_when(table_maker, latest_getter):
     table_maker([])
     res = latest_getter('this', 'that')
@@ -15,6 +15,8 @@ from datetime import datetime, timezone
 from decimal import Decimal
 import pytest
 import simplejson as json
+from datalake.common import Metadata
+from datalake_api.fetcher import MetadataCache
 
 
 @pytest.fixture
@@ -58,3 +60,114 @@ def test_no_such_metadata(s3_bucket_maker, metadata_getter):
     assert 'code' in response
     assert response['code'] == 'NoSuchFile'
     assert 'message' in response
+
+
+def test_metadata_is_cached(metadata_getter, s3_file_maker, s3_connection,
+                            random_metadata):
+    random_metadata['id'] = '12345'
+    s3_file_maker('datalake-test', '12345/data', 'foo', random_metadata)
+    res = metadata_getter('12345')
+    assert res.status_code == 200
+    expected = json.loads(res.data)
+
+    # metadata is immutable, so we should not need to go back to s3
+    s3_connection.Object('datalake-test', '12345/data').delete()
+    res = metadata_getter('12345')
+    assert res.status_code == 200
+    assert json.loads(res.data) == expected
+
+
+def test_metadata_etag(client, metadata_getter, s3_file_maker,
+                       random_metadata):
+    random_metadata['id'] = '12345'
+    s3_file_maker('datalake-test', '12345/data', 'foo', random_metadata)
+    res = metadata_getter('12345')
+    assert res.headers['ETag'] == '"{}"'.format(random_metadata['hash'])
+    assert 'immutable' in res.headers['Cache-Control']
+
+    headers = {'If-None-Match': res.headers['ETag']}
+    res = client.get('/v0/archive/files/12345/metadata', headers=headers)
+    assert res.status_code == 304
+    assert res.get_data() == b''
+    assert 'immutable' in res.headers['Cache-Control']
+
+    headers = {'If-None-Match': '"nope"'}
+    res = client.get('/v0/archive/files/12345/metadata', headers=headers)
+    assert res.status_code == 200
+
+
+def test_metadata_cache_evicts_least_recently_used(random_metadata):
+    cache = MetadataCache(max_size=2)
+    for i in ['1', '2']:
+        random_metadata['id'] = i
+        cache.put(i, Metadata(random_metadata))
+    assert cache.get('1')['id'] == '1'
+    random_metadata['id'] = '3'
+    cache.put('3', Metadata(random_metadata))
+    assert len(cache) == 2
+    assert cache.get('2') is None
+    assert cache.get('1')['id'] == '1'
+    assert cache.get('3')['id'] == '3'
+
+
+def test_metadata_cache_hands_out_copies(random_metadata):
+    cache = MetadataCache()
+    cache.put('1', Metadata(random_metadata))
+    cache.get('1')['start_iso'] = 'foo'
+    assert 'start_iso' not in cache.get('1')
+
+
+@pytest.fixture
+def metadata_poster(client):
+
+    def poster(body):
+        return client.post('/v0/archive/files/metadata', json=body)
+
+    return poster
+
+
+def test_get_many_metadata(metadata_poster, s3_file_maker, random_metadata):
+    ids = ['1', '2', '3']
+    for i in ids:
+        random_metadata['id'] = i
+        s3_file_maker('datalake-test', i + '/data', 'foo', random_metadata)
+    res = metadata_poster({'ids': ids + ['nope', '1']})
+    assert res.status_code == 200
+    assert res.content_type == 'application/json'
+    metadata = json.loads(res.data)['metadata']
+    assert set(metadata) == set(ids + ['nope'])
+    assert metadata['nope'] is None
+    for i in ids:
+        assert metadata[i]['id'] == i
+        assert 'start_iso' in metadata[i]
+
+
+def test_get_many_metadata_from_cache(metadata_poster, s3_file_maker,
+                                      s3_connection, random_metadata):
+    random_metadata['id'] = '12345'
+    s3_file_maker('datalake-test', '12345/data', 'foo', random_metadata)
+    metadata_poster({'ids': ['12345']})
+    s3_connection.Object('datalake-test', '12345/data').delete()
+    res = metadata_poster({'ids': ['12345']})
+    assert json.loads(res.data)['metadata']['12345']['id'] == '12345'
+
+
+@pytest.mark.parametrize('body', [
+    None,
+    [],
+    {},
+    {'ids': []},
+    {'ids': 'abc'},
+    {'ids': [1, 2]},
+])
+def test_get_many_metadata_bad_ids(metadata_poster, body):
+    res = metadata_poster(body)
+    assert res.status_code == 400
+    assert json.loads(res.data)['code'] == 'InvalidIds'
+
+
+def test_get_too_many_metadata(client, metadata_poster):
+    client.application.config['DATALAKE_MAX_METADATA_IDS'] = 2
+    res = metadata_poster({'ids': ['1', '2', '3']})
+    assert res.status_code == 400
+    assert json.loads(res.data)['code'] == 'TooManyIds'
@@ -112,7 +112,8 @@ class Archive(object):
     def _parsed_storage_url(self):
         return urlparse(self.storage_url)
 
-    def list(self, what, start=None, end=None, where=None, work_id=None):
+    def list(self, what, start=None, end=None, where=None, work_id=None,
+             fields=None, limit=None, stream=False):
         '''list metadata records for specified files
 
         Args:
@@ -130,6 +131,17 @@ class Archive(object):
 
           work_id: Show only files with this work id.
 
+          fields: Only retrieve these fields of each record (e.g., ['url',
+          'metadata.id']). This makes for smaller responses.
+
+          limit: The number of records to retrieve per request. The default
+          and maximum is 100, but the maximum is higher if fields is
+          specified.
+
+          stream: if true, have the server page through the results and
+          stream them back to us. This saves a round trip per page, and the
+          records are parsed as they arrive.
+
         returns a generator that lists records of the form:
             {
                 'url': <url>,
@@ -143,7 +155,14 @@ class Archive(object):
             end=None if end is None else Metadata.normalize_date(end),
             where=where,
             work_id=work_id,
+            fields=None if fields is None else ','.join(fields),
+            limit=limit,
         )
+        if stream:
+            for record in self._list_stream(url + 'stream', params):
+                yield record
+            return
+
         response = self._requests_get(url, params=params)
 
         while True:
@@ -156,6 +175,26 @@ class Archive(object):
             else:
                 break
 
+    def _list_stream(self, url, params):
+        response = self._requests_get(url, params=params, stream=True)
+        while True:
+            self._check_http_response(response)
+            trailer = None
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                record = json.loads(line)
+                if 'next' in record:
+                    trailer = record
+                    break
+                yield record
+            response.close()
+            if trailer is None:
+                raise DatalakeHttpError('Datalake HTTP API stream ended early')
+            if trailer['next'] is None:
+                break
+            response = self._requests_get(trailer['next'], stream=True)
+
     def latest(self, what, where, lookback=None):
         url = self.http_url + '/v0/archive/latest/{}/{}'.format(what, where)
         params = dict(
@@ -165,6 +204,60 @@ class Archive(object):
         self._check_http_response(response)
         return response.json()
 
+    def latest_by_what(self, what, lookback=None):
+        '''get the latest file for every where of a what
+
+        Returns a list of records sorted by where. This requires that the
+        datalake API uses the latest table.
+        '''
+        url = self.http_url + '/v0/archive/latest/{}/'.format(what)
+        params = dict(
+            lookback=lookback,
+        )
+        response = self._requests_get(url, params=params)
+        self._check_http_response(response)
+        return response.json()['records']
+
+    # the most what/where pairs that the API accepts in a batch latest request
+    _LATEST_BATCH_SIZE = 1000
+
+    def latest_many(self, pairs, lookback=None):
+        '''get the latest files for many what/where pairs
+
+        Returns a list of records in the same order as the (what, where)
+        pairs. The record is None for pairs that have no latest file.
+        '''
+        url = self.http_url + '/v0/archive/latest/'
+        pairs = [{'what': what, 'where': where} for what, where in pairs]
+        records = []
+        for i in range(0, len(pairs), self._LATEST_BATCH_SIZE):
+            body = {'pairs': pairs[i:i + self._LATEST_BATCH_SIZE]}
+            if lookback is not None:
+                body['lookback'] = lookback
+            response = self._requests_post(url, json=body)
+            self._check_http_response(response)
+            records += response.json()['records']
+        return records
+
+    # the most ids that the API accepts in a batch metadata request
+    _METADATA_BATCH_SIZE = 1000
+
+    def metadata_many(self, ids):
+        '''get the metadata for many files by id
+
+        Returns a dict of id to metadata. The metadata is None for ids that are
+        not in the datalake.
+        '''
+        url = self.http_url + '/v0/archive/files/metadata'
+        ids = list(ids)
+        metadata = {}
+        for i in range(0, len(ids), self._METADATA_BATCH_SIZE):
+            batch = ids[i:i + self._METADATA_BATCH_SIZE]
+            response = self._requests_post(url, json={'ids': batch})
+            self._check_http_response(response)
+            metadata.update(response.json()['metadata'])
+        return metadata
+
     @property
     def http_url(self):
         self._http_url = self._http_url or environ.get('DATALAKE_HTTP_URL')
@@ -178,7 +271,7 @@ class Archive(object):
             msg = '{} ({})'.format(err['message'], err['code'])
             raise DatalakeHttpError(msg)
 
-        elif response.status_code != 200:
+        elif response.status_code not in (200, 206, 304):
             msg = 'Datalake HTTP API failed: {} ({})'
             msg = msg.format(response.content, response.status_code)
             raise DatalakeHttpError(msg)
@@ -261,18 +354,24 @@ class Archive(object):
 
     _URL_FORMAT = 's3://{bucket}/{key}'
 
-    def fetch(self, url, stream=False):
+    def fetch(self, url, stream=False, byte_range=None):
         '''fetch the specified url and return it as a datalake.File
 
         Args:
 
         url: the url to fetch. Both s3 and http(s) are supported.
         stream: if true, return a StreamingFile
+        byte_range: if specified, only fetch this (first, last) range of
+        bytes. The range is inclusive. If last is None, the range extends to
+        the end of the file. A negative first with a last of None fetches
+        the last -first bytes of the file.
         '''
         if url.startswith('s3://'):
-            return self._fetch_s3_url(url, stream=stream)
+            return self._fetch_s3_url(url, stream=stream,
+                                      byte_range=byte_range)
         elif self._is_valid_http_url(url):
-            return self._fetch_http_url(url, stream=stream)
+            return self._fetch_http_url(url, stream=stream,
+                                        byte_range=byte_range)
         else:
             msg = '{} does not appear to be a fetchable url'
             msg = msg.format(url)
@@ -281,31 +380,49 @@ class Archive(object):
     def _is_valid_http_url(self, url):
         return url.startswith('http') and url.endswith('/data')
 
-    def _fetch_s3_url(self, url, stream=False):
-        obj, m = self._get_object_from_url(url)
+    def _fetch_s3_url(self, url, stream=False, byte_range=None):
+        obj, m = self._get_object_from_url(url, byte_range=byte_range)
         if stream:
             return StreamingFile(obj._datalake_details['Body'], **m)
+        if byte_range is not None:
+            fd = BytesIO(obj._datalake_details['Body'].read())
+            return File(fd, **m)
         fd = BytesIO()
         self._s3_bucket.download_fileobj(obj.key, fd)
         fd.seek(0)
         return File(fd, **m)
 
-    def _fetch_http_url(self, url, stream=False):
+    def _fetch_http_url(self, url, stream=False, byte_range=None):
         m = self._get_metadata_from_http_url(url)
-        k = self._stream_http_url(url)
+        k = self._stream_http_url(url, byte_range=byte_range)
         if stream:
-            return StreamingHTTPFile(k, **m)
+            def _range_getter(byte_range):
+                return self._stream_http_url(url, byte_range=byte_range)
+            return StreamingHTTPFile(k, range_getter=_range_getter, **m)
         fd = BytesIO()
         for block in k.iter_content(1024):
             fd.write(block)
         fd.seek(0)
         return File(fd, **m)
 
-    def _stream_http_url(self, url):
-        response = self._requests_get(url, stream=True)
+    def _stream_http_url(self, url, byte_range=None, etag=None):
+        headers = {}
+        if byte_range is not None:
+            headers['Range'] = self._format_byte_range(byte_range)
+        # NB: the API may redirect us to a presigned s3 url for the data.
+        response = self._requests_get(url, etag=etag, stream=True,
+                                      headers=headers, allow_redirects=True)
         self._check_http_response(response)
         return response
 
+    def _format_byte_range(self, byte_range):
+        first, last = byte_range
+        if first < 0:
+            return 'bytes={}'.format(first)
+        if last is None:
+            return 'bytes={}-'.format(first)
+        return 'bytes={}-{}'.format(first, last)
+
     def _get_metadata_from_http_url(self, url):
         self._validate_fetch_url(url)
         p = re.compile('/data$')
@@ -345,12 +462,31 @@ class Archive(object):
         self._mkdirs(dname)
         if k:
             k.get_contents_to_filename(fname)
+        elif self._is_valid_http_url(url):
+            self._fetch_http_url_to_filename(url, fname, m)
         else:
             with open(fname, 'wb') as fh:
                 for buf in self.fetch(url, stream=True).iter_content():
                     fh.write(buf)
         return fname
 
+    def _fetch_http_url_to_filename(self, url, fname, m):
+        # If we already have the file, a conditional request confirms that it
+        # is still in the datalake without transferring it again.
+        etag = m['hash'] if self._has_local_copy(fname, m) else None
+        response = self._stream_http_url(url, etag=etag)
+        if response.status_code == 304:
+            return
+        with open(fname, 'wb') as fh:
+            for buf in StreamingHTTPFile(response, **m).iter_content():
+                fh.write(buf)
+
+    def _has_local_copy(self, fname, m):
+        if not os.path.isfile(fname):
+            return False
+        with open(fname, 'rb') as fd:
+            return File(fd, **m)._calculate_hash() == m['hash']
+
     def _mkdirs(self, path):
         if path == '':
             return
@@ -362,14 +498,17 @@ class Archive(object):
             else:
                 raise
 
-    def _get_object_from_url(self, url):
+    def _get_object_from_url(self, url, byte_range=None):
         self._validate_fetch_url(url)
         key_name = self._get_key_name_from_url(url)
         obj = self._s3.Object(self._s3_bucket_name, key_name)
+        kwargs = {}
+        if byte_range is not None:
+            kwargs['Range'] = self._format_byte_range(byte_range)
         try:
             # cache the results of the get on the obj to avoid superfluous
             # network calls.
-            obj._datalake_details = obj.get()
+            obj._datalake_details = obj.get(**kwargs)
             m = obj._datalake_details['Metadata'].get(METADATA_NAME)
         except self._s3.meta.client.exceptions.NoSuchKey:
             msg = 'Failed to find {} in the datalake.'.format(url)
@@ -465,9 +604,21 @@ class Archive(object):
         boto_session = boto3.Session()
         return boto_session.client('s3')
 
-    def _requests_get(self, url, **kwargs):
+    def _requests_get(self, url, etag=None, **kwargs):
+        '''GET the url, conditionally if the etag of a cached copy is given
+
+        If the server (or a cache along the way) finds that the etag still
+        matches, the response is a 304 without a body.
+        '''
+        if etag is not None:
+            headers = dict(kwargs.pop('headers', None) or {})
+            headers['If-None-Match'] = '"{}"'.format(etag)
+            kwargs['headers'] = headers
         return self._session.get(url, timeout=TIMEOUT(), **kwargs)
 
+    def _requests_post(self, url, **kwargs):
+        return self._session.post(url, timeout=TIMEOUT(), **kwargs)
+
     @property
     def _session(self):
         if self.__session:
@@ -16,6 +16,7 @@ from . import Metadata
 from six.moves.urllib.parse import urlparse
 import json
 import os
+from threading import Lock
 
 
 from .errors import InsufficientConfiguration, UnsupportedTimeRange, \
@@ -29,6 +30,7 @@ InsufficientConfiguration.'''
 has_s3 = True
 try:
     import boto3
+    from botocore.exceptions import ClientError
 except ImportError:
     has_s3 = False
 
@@ -66,14 +68,22 @@ class DatalakeRecord(dict):
 
     @classmethod
     @requires_s3
-    def list_from_url(cls, url):
-        '''return a list of DatalakeRecords for the specified url'''
+    def list_from_url(cls, url, size=None, create_time=None):
+        '''return a list of DatalakeRecords for the specified url
+
+        Only the metadata of the s3 object is fetched, not its content. The
+        size and create_time may be provided (e.g., from an s3 event) if the
+        caller already knows them. Otherwise they come from the s3 object.
+        '''
         obj, metadata = cls._get_object(url)
-        ct = cls._get_create_time(obj)
+        if create_time is None:
+            create_time = cls._get_create_time(obj)
+        if size is None:
+            size = obj.content_length
         time_buckets = cls.get_time_buckets_from_metadata(metadata)
 
         return [
-            cls(url, metadata, t, ct, obj.content_length) for t in time_buckets
+            cls(url, metadata, t, create_time, size) for t in time_buckets
         ]
 
     @classmethod
@@ -106,27 +116,34 @@ class DatalakeRecord(dict):
         obj = cls._connection().Object(parsed_url.netloc, key_name)
 
         try:
-            # cache the results of the get on the obj to avoid superfluous
-            # network calls.
-            obj._datalake_details = obj.get()
-            m = obj._datalake_details['Metadata'].get('datalake')
-        except cls._connection().meta.client.exceptions.NoSuchKey:
-            msg = '{} does not appear to be in the datalake'
-            msg = msg.format(url)
-            raise NoSuchDatalakeFile(msg)
-        except cls._connection().meta.client.exceptions.NoSuchBucket:
-            msg = 'Cannot find datalake file (s3 bucket {} does not exist)'
-            msg = msg.format(bucket)
-            raise NoSuchDatalakeFile(msg)
-
-        return obj, Metadata.from_json(m)
+            # NB: we only need the metadata, size and last modified time. So
+            # we HEAD the object with load() rather than opening a GET of its
+            # (possibly huge) content.
+            obj.load()
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code == 'NoSuchBucket':
+                msg = 'Cannot find datalake file (s3 bucket {} does not exist)'
+                raise NoSuchDatalakeFile(msg.format(bucket))
+            elif code in ('404', 'NoSuchKey'):
+                msg = '{} does not appear to be in the datalake'
+                raise NoSuchDatalakeFile(msg.format(url))
+            raise
+
+        return obj, Metadata.from_json(obj.metadata.get('datalake'))
 
     _CONNECTION = None
+    _CONNECTION_LOCK = Lock()
 
     @classmethod
     def _connection(cls):
+        # NB: records may be made on many threads (e.g., by a concurrent
+        # ingester). Creating a resource from the default boto3 session is not
+        # thread-safe, so only one thread may prepare the connection.
         if cls._CONNECTION is None:
-            cls._CONNECTION = cls._prepare_connection()
+            with cls._CONNECTION_LOCK:
+                if cls._CONNECTION is None:
+                    cls._CONNECTION = cls._prepare_connection()
         return cls._CONNECTION
 
     @classmethod
@@ -12,6 +12,7 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import io
 import os
 try:
     from hashlib import blake2b
@@ -131,9 +132,48 @@ class StreamingHTTPFile(StreamingFile):
     Optimized with larger chunk size for large file delivery over HTTP
     '''
 
+    def __init__(self, stream, range_getter=None, **metadata_fields):
+        '''Create a StreamingHTTPFile
+
+        Args:
+
+            stream: a requests response from which the file data can be read.
+
+            range_getter: a callable that accepts a (first, last) byte range
+            and returns a new response streaming only that range. If
+            provided, the file supports seek.
+
+            metadata_fields: see StreamingFile
+
+        '''
+        super(StreamingHTTPFile, self).__init__(stream, **metadata_fields)
+        self._range_getter = range_getter
+
     def iter_content(self, chunk_size=ITER_SIZE):
         return self._stream.iter_content(chunk_size)
 
+    def seekable(self):
+        return self._range_getter is not None
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        '''seek by re-requesting the file from the new position
+
+        Only non-negative offsets from the start of the file and negative
+        offsets from the end of the file are supported.
+        '''
+        if self._range_getter is None:
+            raise io.UnsupportedOperation('seek')
+        if whence == os.SEEK_SET and offset >= 0:
+            byte_range = (offset, None)
+        elif whence == os.SEEK_END and offset < 0:
+            byte_range = (offset, None)
+        else:
+            msg = 'Unsupported seek to {} with whence {}'
+            raise ValueError(msg.format(offset, whence))
+        stream = self._range_getter(byte_range)
+        self.close()
+        self._stream = stream
+
 
 class File(object):
 
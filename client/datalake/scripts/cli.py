@@ -241,6 +241,14 @@ _list_result_formatters = {
 _list_result_formats = list(_list_result_formatters.keys())
 
 
+# the record fields that each format needs. Formats that are not listed need
+# the whole record.
+_list_result_fields = {
+    'url': ['url'],
+    'http': ['http_url'],
+}
+
+
 @cli.command()
 @click.option('--start')
 @click.option('--end')
@@ -258,7 +266,8 @@ def list(**kwargs):
 def _list(**kwargs):
     format = kwargs.pop('format')
     what = kwargs.pop('what')
-    results = archive.list(what, **kwargs)
+    fields = _list_result_fields.get(format)
+    results = archive.list(what, fields=fields, **kwargs)
     _print_list_results(results, format)
 
 
@@ -118,3 +118,32 @@ def test_record_size_and_create_time(s3_file_maker, random_metadata):
         assert r['metadata'] == random_metadata
         assert abs(r['create_time'] - now) <= max_tolerable_delta
         assert r['size'] == 25
+
+
+@pytest.mark.skipif(not has_s3, reason='requires s3 features')
+def test_list_from_url_does_not_get_content(s3_file_maker, random_metadata,
+                                            monkeypatch):
+    url = 's3://foo/bar'
+    s3_file_maker('foo', 'bar', 'thissongisjust23byteslong', random_metadata)
+    obj_class = type(DatalakeRecord._connection().Object('foo', 'bar'))
+
+    def get(*args, **kwargs):
+        raise AssertionError('records should not GET the s3 content')
+
+    monkeypatch.setattr(obj_class, 'get', get)
+    records = DatalakeRecord.list_from_url(url)
+    assert all(r['size'] == 25 for r in records)
+
+
+@pytest.mark.skipif(not has_s3, reason='requires s3 features')
+def test_list_from_url_with_size_and_create_time(s3_file_maker,
+                                                 random_metadata):
+    url = 's3://foo/bar'
+    s3_file_maker('foo', 'bar', 'thissongisjust23byteslong', random_metadata)
+    records = DatalakeRecord.list_from_url(url, size=1024,
+                                           create_time=1500000000000)
+    assert len(records) >= 1
+    for r in records:
+        assert r['metadata'] == random_metadata
+        assert r['size'] == 1024
+        assert r['create_time'] == 1500000000000
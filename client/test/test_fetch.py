@@ -16,6 +16,7 @@ from datalake import InvalidDatalakePath
 import os
 from io import BytesIO
 import responses
+from hashlib import blake2b
 
 
 def test_invalid_fetch_url(archive):
@@ -184,6 +185,22 @@ def test_fetch_http_url(archive, random_metadata):
     assert f.read() == content
 
 
+@responses.activate
+def test_fetch_http_url_redirected_to_s3(archive, random_metadata):
+    base_url = 'http://datalake.example.com/v0/archive/files/1234/'
+    s3_url = 'https://bucket.s3.amazonaws.com/1234/data?Signature=abc'
+    content = 'foobar'.encode('utf-8')
+    responses.add(responses.GET, base_url + 'data', status=302,
+                  headers={'Location': s3_url})
+    responses.add(responses.GET, s3_url, body=content,
+                  content_type='text/plain', status=200)
+    responses.add(responses.GET, base_url + 'metadata', json=random_metadata,
+                  content_type='application/json', status=200)
+    f = archive.fetch(base_url + 'data')
+    assert f.metadata == random_metadata
+    assert f.read() == content
+
+
 @responses.activate
 def test_cli_fetch_to_file_http_url(
         monkeypatch, cli_tester, random_metadata, tmpdir):
@@ -204,6 +221,42 @@ def test_cli_fetch_to_file_http_url(
     assert contents == content
 
 
+@pytest.fixture
+def local_copy_tester(archive, random_metadata, tmpdir):
+
+    def tester(local_content):
+        base_url = 'http://datalake.example.com/v0/archive/files/1234/'
+        content = 'foobar'.encode('utf-8')
+        random_metadata['hash'] = blake2b(content, digest_size=16).hexdigest()
+        fname = str(tmpdir.join('foobar'))
+        with open(fname, 'wb') as f:
+            f.write(local_content)
+        etag = '"{}"'.format(random_metadata['hash'])
+        responses.add(responses.GET, base_url + 'data', status=304,
+                      match=[responses.matchers.header_matcher(
+                          {'If-None-Match': etag})])
+        responses.add(responses.GET, base_url + 'data', body=content,
+                      content_type='text/plain', status=200)
+        responses.add(responses.GET, base_url + 'metadata',
+                      json=random_metadata, content_type='application/json',
+                      status=200)
+        archive.fetch_to_filename(base_url + 'data', filename_template=fname)
+        assert open(fname, 'rb').read() == content
+        return responses.calls[-1].response.status_code
+
+    return tester
+
+
+@responses.activate
+def test_fetch_http_url_to_existing_file(local_copy_tester):
+    assert local_copy_tester(b'foobar') == 304
+
+
+@responses.activate
+def test_fetch_http_url_to_stale_file(local_copy_tester):
+    assert local_copy_tester(b'stale') == 200
+
+
 def test_invalid_url(archive, random_metadata):
     url = 'http://datalake.example.com/v0/archive/files/1234/'
     with pytest.raises(InvalidDatalakePath):
@@ -251,3 +304,54 @@ def test_fetch_template_with_none(archive, datalake_url_maker, random_metadata,
     expected_path = os.path.join(str(tmpdir), fname)
     archive.fetch_to_filename(url, filename_template=t)
     assert os.path.exists(expected_path)
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+@pytest.mark.parametrize("byte_range,expected", [
+    ((0, 6), b'welcome'),
+    ((11, None), b'the jungle'),
+    ((-6, None), b'jungle'),
+])
+def test_fetch_byte_range(archive, datalake_url_maker, random_metadata,
+                          streaming, byte_range, expected):
+    content = 'welcome to the jungle'.encode('utf-8')
+    url = datalake_url_maker(metadata=random_metadata,
+                             content=content)
+    f = archive.fetch(url, stream=streaming, byte_range=byte_range)
+    assert f.read() == expected
+
+
+@responses.activate
+def test_fetch_http_url_byte_range(archive, random_metadata):
+    base_url = 'http://datalake.example.com/v0/archive/files/1234/'
+    responses.add(responses.GET, base_url + 'data', body=b'bar',
+                  content_type='text/plain', status=206,
+                  match=[responses.matchers.header_matcher(
+                      {'Range': 'bytes=3-5'})])
+    responses.add(responses.GET, base_url + 'metadata', json=random_metadata,
+                  content_type='application/json', status=200)
+    f = archive.fetch(base_url + 'data', byte_range=(3, 5))
+    assert f.read() == b'bar'
+
+
+@responses.activate
+def test_seek_streaming_http_url(archive, random_metadata):
+    base_url = 'http://datalake.example.com/v0/archive/files/1234/'
+    responses.add(responses.GET, base_url + 'data', body=b'foobar',
+                  content_type='text/plain', status=200)
+    responses.add(responses.GET, base_url + 'data', body=b'bar',
+                  content_type='text/plain', status=206,
+                  match=[responses.matchers.header_matcher(
+                      {'Range': 'bytes=3-'})])
+    responses.add(responses.GET, base_url + 'data', body=b'ar',
+                  content_type='text/plain', status=206,
+                  match=[responses.matchers.header_matcher(
+                      {'Range': 'bytes=-2'})])
+    responses.add(responses.GET, base_url + 'metadata', json=random_metadata,
+                  content_type='application/json', status=200)
+    f = archive.fetch(base_url + 'data', stream=True)
+    assert f.read(1) == b'f'
+    f.seek(3)
+    assert f.read() == b'bar'
+    f.seek(-2, os.SEEK_END)
+    assert f.read() == b'ar'
@@ -66,3 +66,74 @@ def test_no_such_latest(archive):
 def test_latest_cli_bad_lookback(cli_tester, random_metadata):
     cmd = 'latest foo bar --lookback nine'
     cli_tester(cmd, expected_exit=2)
+
+
+_LATEST_URL = 'http://datalake.example.com/v0/archive/latest/'
+
+
+@responses.activate
+def test_latest_many(archive, random_metadata):
+    record = {
+        'url': 's3://bucket/file',
+        'metadata': random_metadata,
+    }
+    pairs = [{'what': 'foo', 'where': 'nope'},
+             {'what': random_metadata['what'],
+              'where': random_metadata['where']}]
+    responses.add(responses.POST, _LATEST_URL,
+                  json={'records': [None, record]}, status=200,
+                  match=[responses.matchers.json_params_matcher(
+                      {'pairs': pairs, 'lookback': 7})])
+    pairs = [(p['what'], p['where']) for p in pairs]
+    assert archive.latest_many(pairs, lookback=7) == [None, record]
+
+
+@responses.activate
+def test_latest_many_in_batches(monkeypatch, archive):
+    monkeypatch.setattr(archive, '_LATEST_BATCH_SIZE', 2)
+    wheres = [['a', 'b'], ['c']]
+    for batch in wheres:
+        pairs = [{'what': 'foo', 'where': w} for w in batch]
+        responses.add(responses.POST, _LATEST_URL,
+                      json={'records': [None] * len(batch)}, status=200,
+                      match=[responses.matchers.json_params_matcher(
+                          {'pairs': pairs})])
+    pairs = iter([('foo', 'a'), ('foo', 'b'), ('foo', 'c')])
+    assert archive.latest_many(pairs) == [None, None, None]
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_latest_many_bad_request(archive):
+    r = {
+        'code': 'TooManyPairs',
+        'message': 'Please provide at most 1000 pairs',
+    }
+    responses.add(responses.POST, _LATEST_URL, json=r, status=400)
+    with pytest.raises(DatalakeHttpError):
+        archive.latest_many([('foo', 'bar')])
+
+
+@responses.activate
+def test_latest_by_what(archive, random_metadata):
+    record = {
+        'url': 's3://bucket/file',
+        'metadata': random_metadata,
+    }
+    url = 'http://datalake.example.com/v0/archive/latest/{}/'
+    url = url.format(random_metadata['what'])
+    prepare_response({'records': [record]}, url=url, lookback=7)
+    records = archive.latest_by_what(random_metadata['what'], lookback=7)
+    assert records == [record]
+
+
+@responses.activate
+def test_latest_by_what_without_latest_table(archive):
+    r = {
+        'code': 'NoLatestTable',
+        'message': 'The latest file for every where requires the latest table',
+    }
+    url = 'http://datalake.example.com/v0/archive/latest/foo/'
+    prepare_response(r, status=400, url=url)
+    with pytest.raises(DatalakeHttpError):
+        archive.latest_by_what('foo')
@@ -93,6 +93,26 @@ def test_internal_server_error(archive):
         list(archive.list('syslog'))
 
 
+@responses.activate
+def test_list_fields_and_limit(archive, random_metadata):
+    r = {
+        'records': [
+            {
+                'url': 's3://bucket/file',
+                'metadata': {'id': random_metadata['id']},
+            }
+        ],
+        'next': None,
+    }
+    prepare_response(r, what=random_metadata['what'],
+                     work_id='foo123',
+                     fields='url%2Cmetadata.id',
+                     limit=500)
+    l = list(archive.list(random_metadata['what'], work_id='foo123',
+                          fields=['url', 'metadata.id'], limit=500))
+    assert l == r['records']
+
+
 @pytest.fixture
 def date_tester(archive, random_metadata):
 
@@ -197,7 +217,8 @@ def test_list_cli_url_format(cli_tester, random_metadata):
     }
     prepare_response(r, what=random_metadata['what'],
                      start=random_metadata['start'],
-                     end=random_metadata['end'])
+                     end=random_metadata['end'],
+                     fields='url')
     cmd = 'list {what} --start={start} --end={end}'
     cmd = cmd.format(**random_metadata)
     output = cli_tester(cmd)
@@ -258,7 +279,8 @@ def test_list_cli_http_format(cli_tester, random_metadata):
         ],
         'next': None,
     }
-    prepare_response(r, what=m1['what'], work_id=m1['work_id'])
+    prepare_response(r, what=m1['what'], work_id=m1['work_id'],
+                     fields='http_url')
     cmd = 'list {what} --work-id={work_id} --format=http'
     cmd = cmd.format(**m1)
     output = cli_tester(cmd).rstrip('\n').split('\n')
@@ -409,3 +431,53 @@ def test_list_with_session_class(monkeypatch,
     assert len(l) > 0
     assert l[0]['url'] == 's3://bucket/file'
     assert l[0]['metadata'] == random_metadata
+
+
+def _ndjson(*lines):
+    return ''.join(json.dumps(l) + '\n' for l in lines)
+
+
+@responses.activate
+def test_list_stream(archive, random_metadata):
+    m1 = copy(random_metadata)
+    m1['id'] = '1'
+    m2 = copy(random_metadata)
+    m2['id'] = '2'
+    url = 'http://datalake.example.com/v0/archive/files/stream'
+    next_url = url + '?what=foo&cursor=abc'
+    body = _ndjson({'url': 's3://bucket/file1', 'metadata': m1},
+                   {'next': next_url, 'cursor': 'abc'})
+    responses.add(responses.GET, url, body=body, status=200,
+                  content_type='application/x-ndjson',
+                  match=[responses.matchers.query_string_matcher(
+                      'what=foo&work_id=job0')])
+    body = _ndjson({'url': 's3://bucket/file2', 'metadata': m2},
+                   {'next': None, 'cursor': None})
+    responses.add(responses.GET, next_url, body=body, status=200,
+                  content_type='application/x-ndjson')
+    l = list(archive.list('foo', work_id='job0', stream=True))
+    assert [r['metadata'] for r in l] == [m1, m2]
+
+
+@responses.activate
+def test_list_stream_cut_short(archive, random_metadata):
+    url = 'http://datalake.example.com/v0/archive/files/stream'
+    body = _ndjson({'url': 's3://bucket/file1', 'metadata': random_metadata})
+    responses.add(responses.GET, url, body=body, status=200,
+                  content_type='application/x-ndjson')
+    l = archive.list('foo', work_id='job0', stream=True)
+    assert next(l)['metadata'] == random_metadata
+    with pytest.raises(DatalakeHttpError):
+        next(l)
+
+
+@responses.activate
+def test_list_stream_bad_request(archive):
+    r = {
+        "code": "NoWorkInterval",
+        "message": "You must provide either work_id or start/end"
+    }
+    url = 'http://datalake.example.com/v0/archive/files/stream'
+    prepare_response(r, status=400, url=url, what='syslog')
+    with pytest.raises(DatalakeHttpError):
+        list(archive.list('syslog', stream=True))
@@ -0,0 +1,42 @@
+import pytest
+import responses
+from copy import copy
+from datalake import DatalakeHttpError
+
+
+_URL = 'http://datalake.example.com/v0/archive/files/metadata'
+
+
+@responses.activate
+def test_metadata_many(archive, random_metadata):
+    m1 = copy(random_metadata)
+    m1['id'] = '1'
+    r = {'metadata': {'1': m1, '2': None}}
+    responses.add(responses.POST, _URL, json=r, status=200,
+                  match=[responses.matchers.json_params_matcher(
+                      {'ids': ['1', '2']})])
+    assert archive.metadata_many(['1', '2']) == {'1': m1, '2': None}
+
+
+@responses.activate
+def test_metadata_many_in_batches(monkeypatch, archive):
+    monkeypatch.setattr(archive, '_METADATA_BATCH_SIZE', 2)
+    for batch in [['1', '2'], ['3']]:
+        r = {'metadata': {i: None for i in batch}}
+        responses.add(responses.POST, _URL, json=r, status=200,
+                      match=[responses.matchers.json_params_matcher(
+                          {'ids': batch})])
+    m = archive.metadata_many(iter(['1', '2', '3']))
+    assert m == {'1': None, '2': None, '3': None}
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_metadata_many_bad_request(archive):
+    r = {
+        'code': 'TooManyIds',
+        'message': 'Please provide at most 1000 ids',
+    }
+    responses.add(responses.POST, _URL, json=r, status=400)
+    with pytest.raises(DatalakeHttpError):
+        archive.metadata_many(['1'])
@@ -1,6 +1,7 @@
 import click
 from datalake.common.conf import load_config
 from .ingester import Ingester
+from .supervisor import IngesterSupervisor
 from .log import configure_logging
 
 
@@ -21,6 +22,8 @@ DEFAULT_CONFIG = '/etc/datalake-ingester.env'
               help='AWS s3 host (e.g., s3-us-gov-west-1.amazonaws.com)')
 @click.option('-q', '--queue',
               help='name of the ingestion queue (e.g., datalake-sqs)')
+@click.option('-n', '--ingestion-concurrency',
+              help='number of queue messages to handle at once.')
 @click.pass_context
 def cli(ctx, **kwargs):
     conf = kwargs.pop('config')
@@ -34,7 +37,12 @@ def _subcommand_or_fail(ctx):
 
 
 @cli.command()
-def listen():
-    i = Ingester.from_config()
-    i.listen()
+@click.option('-p', '--processes', type=int, default=1,
+              help='number of ingester processes to run.')
+def listen(processes):
+    if processes > 1:
+        IngesterSupervisor(processes).run()
+    else:
+        i = Ingester.from_config()
+        i.listen()
 
@@ -23,3 +23,8 @@ class InvalidS3Notification(InvalidS3Error):
 
 class InvalidS3Event(InvalidS3Error):
     pass
+
+
+class UnprocessedItems(Exception):
+    '''dynamodb would not write some items even after retries'''
+    pass
@@ -82,8 +82,7 @@ class Ingester(object):
     def ingest(self, url):
         '''ingest the metadata associated with the given url'''
         records = DatalakeRecord.list_from_url(url)
-        for r in records:
-            self.storage.store(r)
+        self.storage.store_many(records)
 
     def handler(self, msg):
         ir = IngesterReport().start()
@@ -100,38 +99,52 @@ class Ingester(object):
 
     def _handler(self, s3_notification, ir):
 
+        # we gather the records of all of the events so that they can be
+        # written in as few batches as possible. Records from the events
+        # before a bad one are still written, just as if we had written them
+        # as we went.
+        added = []
+        updated = []
         n = S3Notification(s3_notification)
-        for e in n.events:
-            if e.event_name == 'ObjectCreated:Put':
-                self._add_records(e.datalake_records, ir)
-            elif e.event_name == 'ObjectCreated:Copy':
-                self._update_records(e.datalake_records, ir)
-            elif e.event_name == 'ObjectCreated:CompleteMultipartUpload':
-                self._add_records(e.datalake_records, ir)
-            else:
-                msg = 'Datalake does not support S3 publish event type {}.'
-                msg = msg.format(e.event_name)
-                raise UnsupportedS3Event(msg)
+        try:
+            for e in n.events:
+                if e.event_name == 'ObjectCreated:Put':
+                    added += e.datalake_records
+                elif e.event_name == 'ObjectCreated:Copy':
+                    updated += e.datalake_records
+                elif e.event_name == 'ObjectCreated:CompleteMultipartUpload':
+                    added += e.datalake_records
+                else:
+                    msg = 'Datalake does not support S3 publish event type {}.'
+                    msg = msg.format(e.event_name)
+                    raise UnsupportedS3Event(msg)
+        finally:
+            self._add_records(added, ir)
+            self._update_records(updated, ir)
 
     def _add_records(self, datalake_records, ir):
         for r in datalake_records:
             ir.add_record(r)
-            self.storage.store(r)
+        self.storage.store_many(datalake_records)
 
     def _update_records(self, datalake_records, ir):
         for r in datalake_records:
             ir.add_record(r)
-            self.storage.update(r)
+        self.storage.update_many(datalake_records)
 
     def _report(self, r):
         if self.reporter is None:
             return
         self.reporter.report(r)
 
-    def listen(self, timeout=None):
-        '''listen to the queue, ingest what you hear, and report'''
+    def listen(self, timeout=None, stop=None):
+        '''listen to the queue, ingest what you hear, and report
+
+        If stop (e.g., a threading.Event) is specified, we stop listening once
+        it is set and the messages in hand have been ingested.
+        '''
         if not self.queue:
             raise InsufficientConfiguration('No queue configured.')
 
         self.queue.set_handler(self.handler)
-        self.queue.drain(timeout=timeout)
+        self.queue.drain(timeout=timeout, stop=stop)
@@ -17,15 +17,32 @@ import boto3
 import simplejson as json
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor, wait
 from datalake.common.errors import InsufficientConfiguration
 
 
+'''the default number of messages to handle at once'''
+DEFAULT_CONCURRENCY = 1
+
+
+'''the default number of seconds for which received messages are hidden
+
+Messages that take longer than half of this to handle have their visibility
+extended so that other ingesters do not receive them while we work.
+'''
+DEFAULT_VISIBILITY_TIMEOUT = 60
+
+
 class SQSQueue(object):
     '''A queue that hears events on an SQS queue and translates them'''
 
-    def __init__(self, queue_name, handler=None):
+    def __init__(self, queue_name, handler=None,
+                 concurrency=DEFAULT_CONCURRENCY,
+                 visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
         self.queue_name = queue_name
         self.handler = handler
+        self.concurrency = concurrency or 1
+        self.visibility_timeout = visibility_timeout
         self.logger = logging.getLogger(queue_name)
 
     @classmethod
@@ -33,7 +50,13 @@ class SQSQueue(object):
         queue_name = os.environ.get('DATALAKE_INGESTION_QUEUE')
         if queue_name is None:
             raise InsufficientConfiguration('Please configure a queue')
-        return cls(queue_name)
+        concurrency = int(os.environ.get('DATALAKE_INGESTION_CONCURRENCY',
+                                         DEFAULT_CONCURRENCY))
+        visibility_timeout = int(os.environ.get(
+            'DATALAKE_INGESTION_VISIBILITY_TIMEOUT',
+            DEFAULT_VISIBILITY_TIMEOUT))
+        return cls(queue_name, concurrency=concurrency,
+                   visibility_timeout=visibility_timeout)
 
     def set_handler(self, h):
         self.handler = h
@@ -47,32 +70,90 @@ class SQSQueue(object):
     def _queue(self):
         return self._connection.get_queue_by_name(QueueName=self.queue_name)
 
+    @memoized_property
+    def _executor(self):
+        # NB: the handler runs on these threads. Our own SQS calls (receive,
+        # delete and visibility changes) all happen on the draining thread.
+        return ThreadPoolExecutor(max_workers=self.concurrency)
+
     _LONG_POLL_TIMEOUT = 20
 
-    def drain(self, timeout=None):
+    # the most messages that SQS will deliver in one receive
+    _MAX_MESSAGES = 10
+
+    def drain(self, timeout=None, stop=None):
         '''drain the queue of message, invoking the handler for each item
+
+        Messages are received in batches and handled concurrently. Those that
+        are handled successfully are deleted in a batch. If the handler raises
+        for any message, the rest of the batch is still handled and then the
+        first exception is raised.
+
+        If stop (e.g., a threading.Event) is specified, draining ends once it
+        is set and the messages in hand have been handled.
         '''
         long_poll_timeout = timeout or self._LONG_POLL_TIMEOUT
-        while True:
+        while stop is None or not stop.is_set():
             messages = self._queue.receive_messages(
-                MaxNumberOfMessages=1,
-                WaitTimeSeconds=long_poll_timeout
+                MaxNumberOfMessages=self._MAX_MESSAGES,
+                WaitTimeSeconds=long_poll_timeout,
+                VisibilityTimeout=self.visibility_timeout,
             )
             if not messages:
                 if timeout:
                     return
                 else:
                     continue
-            self._handle_raw_message(messages[0])
+            self._handle_raw_messages(messages)
+
+    def _handle_raw_messages(self, raw_msgs):
+        futures = {self._executor.submit(self._handle_raw_message, m): m
+                   for m in raw_msgs}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=self.visibility_timeout / 2)
+            if pending:
+                self._extend_visibility([futures[f] for f in pending])
+
+        handled = []
+        error = None
+        for f, m in futures.items():
+            if f.exception() is None:
+                if f.result():
+                    handled.append(m)
+            elif error is None:
+                error = f.exception()
+        self._delete(handled)
+        if error is not None:
+            raise error
 
     def _handle_raw_message(self, raw_msg):
         raw = raw_msg.body.replace('\n', ' ')
         if not self.handler:
             self.logger.error('NO HANDLER CONFIGURED: %s', raw)
-            return
+            return False
 
         self.logger.info('RECEIVED: %s', raw)
         msg = json.loads(raw)
 
         self.handler(msg)
-        raw_msg.delete()
+        return True
+
+    def _extend_visibility(self, raw_msgs):
+        self.logger.info('EXTENDING VISIBILITY: %d messages', len(raw_msgs))
+        entries = [{'Id': str(i),
+                    'ReceiptHandle': m.receipt_handle,
+                    'VisibilityTimeout': self.visibility_timeout}
+                   for i, m in enumerate(raw_msgs)]
+        response = self._queue.change_message_visibility_batch(Entries=entries)
+        for failure in response.get('Failed', []):
+            self.logger.warning('FAILED TO EXTEND VISIBILITY: %s', failure)
+
+    def _delete(self, raw_msgs):
+        if not raw_msgs:
+            return
+        entries = [{'Id': str(i), 'ReceiptHandle': m.receipt_handle}
+                   for i, m in enumerate(raw_msgs)]
+        response = self._queue.delete_messages(Entries=entries)
+        for failure in response.get('Failed', []):
+            self.logger.warning('FAILED TO DELETE: %s', failure)
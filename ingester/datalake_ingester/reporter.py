@@ -3,6 +3,7 @@ import simplejson as json
 import logging
 from memoized_property import memoized_property
 import os
+from threading import Lock
 
 
 class SNSReporter(object):
@@ -10,6 +11,7 @@ class SNSReporter(object):
 
     def __init__(self, report_key):
         self.report_key = report_key
+        self._connection_lock = Lock()
         self.logger = logging.getLogger(self._log_name)
 
     @classmethod
@@ -25,8 +27,11 @@ class SNSReporter(object):
 
     @memoized_property
     def _connection(self):
+        # NB: reports are made from the queue's handler threads. Creating a
+        # client from the default boto3 session is not thread-safe.
         region = os.environ.get('AWS_REGION', 'us-east-1')
-        return boto3.client('sns', region_name=region)
+        with self._connection_lock:
+            return boto3.client('sns', region_name=region)
 
     def report(self, ingestion_report):
         message = json.dumps(ingestion_report)
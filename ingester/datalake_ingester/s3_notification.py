@@ -16,7 +16,7 @@ from memoized_property import memoized_property
 import simplejson as json
 
 from .errors import InvalidS3Notification, InvalidS3Event
-from datalake.common import DatalakeRecord
+from datalake.common import DatalakeRecord, Metadata
 
 
 class S3Notification(dict):
@@ -64,7 +64,9 @@ class S3Event(dict):
     def datalake_records(self):
         if self['eventName'] not in self.EVENTS_WITH_RECORDS:
             return []
-        return [dlr for dlr in DatalakeRecord.list_from_url(self.s3_url)]
+        records = DatalakeRecord.list_from_url(self.s3_url, size=self.size,
+                                               create_time=self.event_time)
+        return [dlr for dlr in records]
 
     @property
     def s3_url(self):
@@ -81,3 +83,16 @@ class S3Event(dict):
     @property
     def event_name(self):
         return self['eventName']
+
+    @property
+    def size(self):
+        '''the size of the object in bytes, if the event says'''
+        return self['s3']['object'].get('size')
+
+    @property
+    def event_time(self):
+        '''the time of the event in ms since the epoch, if the event says'''
+        t = self.get('eventTime')
+        if t is None:
+            return None
+        return Metadata.normalize_date(t)
@@ -17,8 +17,25 @@ from memoized_property import memoized_property
 import boto3
 from botocore.exceptions import ClientError
 import os
+import time
+from collections import OrderedDict
 from datalake.common.errors import InsufficientConfiguration
 import logging
+from .errors import UnprocessedItems
+
+
+'''the maximum number of items that dynamodb accepts in a BatchWriteItem'''
+BATCH_WRITE_SIZE = 25
+
+
+'''the number of times to ask dynamodb to write unprocessed items
+
+dynamodb may not process all of the items in a batch (e.g., when throttled). We
+retry the leftovers with exponential backoff. If items remain unprocessed after
+this many attempts we give up and raise UnprocessedItems.
+'''
+BATCH_WRITE_ATTEMPTS = 8
+_BATCH_WRITE_BACKOFF_SECONDS = 0.05
 
 
 class DynamoDBStorage(object):
@@ -57,27 +74,78 @@ class DynamoDBStorage(object):
     def _table(self):
         return self._connection.Table(self.table_name)
 
+    @memoized_property
+    def _key_names(self):
+        return [k['AttributeName'] for k in self._table.key_schema]
+
     @memoized_property
     def _latest_table(self):
         return self._connection.Table(self.latest_table_name)
 
     def store(self, record):
-        try:
-            self._table.put_item(Item=record)
-        except ClientError as e:
-            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
-                pass
-            else:
-                raise
+        self.store_many([record])
+
+    def store_many(self, records):
+        '''store many records in batches
+
+        The records may come from one or many files. If there is a latest
+        table, only the record with the latest start for each what:where in
+        the batch is offered to it.
+        '''
+        self._batch_put(records)
         if self.latest_table_name:
-            self.store_latest(record)
+            for record in self._coalesce_latest(records):
+                self.store_latest(record)
 
     def update(self, record):
-        self._table.put_item(Item=record)
+        self.update_many([record])
+
+    def update_many(self, records):
+        '''update many records in batches without touching the latest table'''
+        self._batch_put(records)
+
+    def _coalesce_latest(self, records):
+        latest = OrderedDict()
+        for r in records:
+            m = r['metadata']
+            key = m['what'] + ':' + m['where']
+            # like the conditional put, a later record with the same start
+            # replaces an earlier one.
+            if key not in latest or \
+               latest[key]['metadata']['start'] <= m['start']:
+                latest[key] = r
+        return list(latest.values())
+
+    def _batch_put(self, records):
+        # dynamodb rejects batches that write the same key twice. So only the
+        # last record for each key is written, just as if we put them all.
+        items = OrderedDict()
+        for r in records:
+            items[tuple(r[k] for k in self._key_names)] = r
+        items = list(items.values())
+        for i in range(0, len(items), BATCH_WRITE_SIZE):
+            batch = items[i:i + BATCH_WRITE_SIZE]
+            requests = [{'PutRequest': {'Item': item}} for item in batch]
+            self._batch_write({self.table_name: requests})
+
+    def _batch_write(self, request):
+        for attempt in range(BATCH_WRITE_ATTEMPTS):
+            if attempt > 0:
+                time.sleep(_BATCH_WRITE_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            response = self._connection.batch_write_item(RequestItems=request)
+            request = response.get('UnprocessedItems')
+            if not request:
+                return
+        n = sum(len(r) for r in request.values())
+        msg = '{} items remain unprocessed after {} attempts'
+        raise UnprocessedItems(msg.format(n, BATCH_WRITE_ATTEMPTS))
 
     def store_latest(self, record):
         """
         Store the latest record for a given what:where key with conditional put.
+
+        The what and where are also stored as what_key and where_key, which
+        key the what-index of the latest table.
         """
         condition_expression = "attribute_not_exists(what_where_key) OR metadata.#metadata_start <= :new_start"
 
@@ -102,6 +170,8 @@ class DynamoDBStorage(object):
 
         record = {
             'what_where_key': record['metadata']['what']+':'+record['metadata']['where'],
+            'what_key': str(record['metadata']['what']),
+            'where_key': str(record['metadata']['where']),
             'time_index_key': record['time_index_key'],
             'range_key': record['range_key'],
             'metadata': {
@@ -118,7 +188,7 @@ class DynamoDBStorage(object):
             'url': record['url'],
             'create_time': record['create_time']
         }
-        self.logger.info(f"Attempting to store record: {record}")
+        self.logger.debug(f"Attempting to store record: {record}")
         try:
             self._latest_table.put_item(
                 Item=record,
@@ -126,7 +196,7 @@ class DynamoDBStorage(object):
                 ExpressionAttributeNames=expression_attribute_names,
                 ExpressionAttributeValues=expression_attribute_values,
             )
-            self.logger.info("Record stored successfully.")
+            self.logger.debug("Record stored successfully.")
         except ClientError as e:
             if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
                 self.logger.debug(f"Condition not met for record {record},"
@@ -0,0 +1,130 @@
+# Copyright 2015 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import logging
+import multiprocessing
+import signal
+import time
+from .ingester import Ingester
+
+
+logger = logging.getLogger('supervisor')
+
+
+'''the default number of seconds between throughput reports'''
+DEFAULT_REPORT_INTERVAL = 60
+
+
+class _WorkerIngester(Ingester):
+    '''an ingester that counts the messages that it handles'''
+
+    handled = None
+
+    def handler(self, msg):
+        super(_WorkerIngester, self).handler(msg)
+        with self.handled.get_lock():
+            self.handled.value += 1
+
+
+def listen(stop, handled):
+    '''ingest from the configured queue until stop is set
+
+    This is the work of each worker process. It builds its own queue, storage
+    and reporter from the configuration and counts what it handles in handled.
+    '''
+    ingester = _WorkerIngester.from_config()
+    ingester.handled = handled
+    ingester.listen(stop=stop)
+
+
+def _run_worker(target, stop, handled):
+    # a SIGTERM to any worker stops them all gracefully. The supervisor sees
+    # to SIGINT (e.g., ctrl-c in a terminal) so that workers only stop once.
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    target(stop, handled)
+
+
+class IngesterSupervisor(object):
+    '''run ingesters in many processes, restarting any that crash
+
+    On SIGTERM or SIGINT the workers are asked to stop. Each finishes the
+    messages in hand before it exits, and then so does the supervisor.
+    '''
+
+    def __init__(self, processes, target=listen,
+                 report_interval=DEFAULT_REPORT_INTERVAL, check_interval=1):
+        self.processes = processes
+        self.target = target
+        self.report_interval = report_interval
+        self.check_interval = check_interval
+        self.stop = multiprocessing.Event()
+        self.handled = [multiprocessing.Value('L', 0)
+                        for _ in range(processes)]
+        self.starts = [0] * processes
+        self._workers = [None] * processes
+
+    def run(self):
+        handlers = {s: signal.signal(s, self._request_stop)
+                    for s in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            self._supervise()
+        finally:
+            for s, h in handlers.items():
+                signal.signal(s, h)
+
+    def _request_stop(self, signum, frame):
+        logger.info('STOPPING: received signal %d', signum)
+        self.stop.set()
+
+    def _supervise(self):
+        last_report = time.time()
+        last_counts = self._counts()
+        while not self.stop.is_set():
+            for i in range(self.processes):
+                self._start_if_stopped(i)
+            self.stop.wait(self.check_interval)
+            now = time.time()
+            if now - last_report >= self.report_interval:
+                counts = self._counts()
+                self._report(counts, last_counts, now - last_report)
+                last_report, last_counts = now, counts
+        for w in self._workers:
+            if w is not None:
+                w.join()
+        self._report(self._counts(), last_counts, time.time() - last_report)
+
+    def _start_if_stopped(self, i):
+        w = self._workers[i]
+        if w is not None and w.is_alive():
+            return
+        if w is not None:
+            logger.warning('RESTARTING: worker %d exited with %s',
+                           i, w.exitcode)
+        w = multiprocessing.Process(
+            target=_run_worker,
+            args=(self.target, self.stop, self.handled[i]),
+            name='ingester-{}'.format(i))
+        w.start()
+        self._workers[i] = w
+        self.starts[i] += 1
+
+    def _counts(self):
+        return [h.value for h in self.handled]
+
+    def _report(self, counts, last_counts, duration):
+        deltas = [c - last for c, last in zip(counts, last_counts)]
+        rate = sum(deltas) / duration if duration > 0 else 0.0
+        logger.info('THROUGHPUT: %d messages in %.1fs (%.1f/s); by worker: %s',
+                    sum(deltas), duration, rate, deltas)
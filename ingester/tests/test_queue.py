@@ -52,3 +52,59 @@ def test_sqs_queue_drain(bare_sqs_queue, handler):
     handler.messages = []
     q.drain(timeout=1)
     assert handler.messages == []
+
+
+def test_sqs_queue_drain_batch(bare_sqs_queue, handler):
+    queue_name = bare_sqs_queue.url.split('/')[-1]
+    q = SQSQueue(queue_name, handler, concurrency=4)
+    expected_msgs = [{'foo': i} for i in range(15)]
+    for msg in expected_msgs:
+        bare_sqs_queue.send_message(MessageBody=json.dumps(msg))
+    handler.messages = []
+    q.drain(timeout=1)
+    assert sorted(handler.messages, key=lambda m: m['foo']) == expected_msgs
+    handler.messages = []
+    q.drain(timeout=1)
+    assert handler.messages == []
+
+
+def test_sqs_queue_drain_failure(bare_sqs_queue):
+    queue_name = bare_sqs_queue.url.split('/')[-1]
+    handled = []
+
+    def handler(msg):
+        if msg['foo'] == 'bad':
+            raise ValueError('bad message')
+        handled.append(msg)
+
+    q = SQSQueue(queue_name, handler, concurrency=2, visibility_timeout=1)
+    for foo in ['good', 'bad', 'better']:
+        bare_sqs_queue.send_message(MessageBody=json.dumps({'foo': foo}))
+    with pytest.raises(ValueError):
+        q.drain(timeout=1)
+    assert sorted(m['foo'] for m in handled) == ['better', 'good']
+
+    # only the bad message should come back once it is visible again
+    time.sleep(1.1)
+    handled[:] = []
+    with pytest.raises(ValueError):
+        q.drain(timeout=1)
+    assert handled == []
+
+
+def test_sqs_queue_extends_visibility(bare_sqs_queue, monkeypatch):
+    queue_name = bare_sqs_queue.url.split('/')[-1]
+    q = SQSQueue(queue_name, lambda msg: time.sleep(1.5),
+                 visibility_timeout=2)
+    extended = []
+    extend_visibility = q._extend_visibility
+
+    def spy(raw_msgs):
+        extended.append(raw_msgs)
+        extend_visibility(raw_msgs)
+
+    monkeypatch.setattr(q, '_extend_visibility', spy)
+    bare_sqs_queue.send_message(MessageBody=json.dumps({'foo': 'slow'}))
+    q.drain(timeout=1)
+    assert len(extended) == 1
+    assert [json.loads(m.body) for m in extended[0]] == [{'foo': 'slow'}]
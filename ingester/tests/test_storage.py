@@ -1,4 +1,6 @@
-from datalake_ingester import DynamoDBStorage
+import pytest
+from datalake_ingester import DynamoDBStorage, UnprocessedItems
+from datalake_ingester import storage as storage_module
 from decimal import Decimal
 
 
@@ -49,11 +51,15 @@ def test_insert_new_record(dynamodb_latest_table, dynamodb_connection):
     )
     stored_record = response['Item']
     assert stored_record['metadata']['start'] == new_record['metadata']['start']
+    assert stored_record['what_key'] == 'syslog'
+    assert stored_record['where_key'] == 'ground_server2'
 
 
 def provide_test_records():
     file1 = {
         'what_where_key': 'syslog:ground_server2',
+        'what_key': 'syslog',
+        'where_key': 'ground_server2',
         'time_index_key': '15219:zlcdzvawsp',
         'range_key': 'lawvuunyws:447a4a801cabc6089f04922abdfa8aad099824e9',
         'metadata': {
@@ -73,6 +79,8 @@ def provide_test_records():
 
     file2 = {
         'what_where_key': 'syslog:ground_server2',
+        'what_key': 'syslog',
+        'where_key': 'ground_server2',
         'time_index_key': '15219:zlcdzvawsp',
         'range_key': 'lawvuunyws:447a4a801cabc6089f04922abdfa8aad099824e9',
         'metadata': {
@@ -93,6 +101,8 @@ def provide_test_records():
 
     file3 = {
         'what_where_key': 'syslog:s114',
+        'what_key': 'syslog',
+        'where_key': 's114',
         'time_index_key': '15220:syslog',
         'range_key': 'ground_server2:34fb2d1ec54245c7a57e29ed5a6ea9b2',
         'metadata': {
@@ -202,3 +212,87 @@ def test_verify_replace_record_same_start(dynamodb_latest_table, dynamodb_connec
     stored_record = response['Item']
     assert stored_record['metadata']['start'] == record1['metadata']['start']
     assert stored_record['metadata']['id'] == "abc123"
+
+
+def _make_records(n, what='syslog', where='ground_server2', start=0):
+    file1, _, _ = provide_test_records()
+    records = []
+    for i in range(n):
+        r = dict(file1, range_key='{}:{}'.format(where, i))
+        r['metadata'] = dict(file1['metadata'], what=what, where=where,
+                             start=start + i, id='file{}'.format(i))
+        records.append(r)
+    return records
+
+
+def test_store_many(dynamodb_records_table, dynamodb_connection):
+    storage = DynamoDBStorage('records', connection=dynamodb_connection)
+    records = _make_records(60)
+    # a duplicate key in the same batch is written just once
+    storage.store_many(records + records[:1])
+    items = dynamodb_records_table.scan()['Items']
+    assert sorted(i['range_key'] for i in items) == \
+        sorted(r['range_key'] for r in records)
+
+
+def test_store_many_coalesces_latest(dynamodb_records_table,
+                                     dynamodb_latest_table,
+                                     dynamodb_connection, monkeypatch):
+    storage = DynamoDBStorage('records', 'latest',
+                              connection=dynamodb_connection)
+    records = _make_records(5, where='a', start=10) + \
+        _make_records(3, where='b', start=20)
+    stored = []
+    store_latest = storage.store_latest
+
+    def spy(record):
+        stored.append(record['metadata']['id'])
+        store_latest(record)
+
+    monkeypatch.setattr(storage, 'store_latest', spy)
+    storage.store_many(records)
+    assert stored == ['file4', 'file2']
+    items = dynamodb_latest_table.scan()['Items']
+    assert sorted(i['metadata']['start'] for i in items) == [14, 22]
+
+
+class _ThrottlingConnection(object):
+    '''a dynamodb resource that leaves items unprocessed a few times'''
+
+    def __init__(self, connection, throttles):
+        self._connection = connection
+        self.throttles = throttles
+        self.batch_sizes = []
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def batch_write_item(self, RequestItems):
+        (name, requests), = RequestItems.items()
+        self.batch_sizes.append(len(requests))
+        if self.throttles == 0:
+            return self._connection.batch_write_item(RequestItems=RequestItems)
+        self.throttles -= 1
+        response = self._connection.batch_write_item(
+            RequestItems={name: requests[:1]})
+        response['UnprocessedItems'] = {name: requests[1:]}
+        return response
+
+
+def test_store_many_retries_unprocessed(dynamodb_records_table,
+                                        dynamodb_connection):
+    connection = _ThrottlingConnection(dynamodb_connection, throttles=2)
+    storage = DynamoDBStorage('records', connection=connection)
+    storage.store_many(_make_records(4))
+    assert connection.batch_sizes == [4, 3, 2]
+    assert len(dynamodb_records_table.scan()['Items']) == 4
+
+
+def test_store_many_gives_up(dynamodb_records_table, dynamodb_connection,
+                             monkeypatch):
+    monkeypatch.setattr(storage_module, '_BATCH_WRITE_BACKOFF_SECONDS', 0)
+    connection = _ThrottlingConnection(dynamodb_connection, throttles=100)
+    storage = DynamoDBStorage('records', connection=connection)
+    with pytest.raises(UnprocessedItems):
+        storage.store_many(_make_records(20))
+    assert len(connection.batch_sizes) == storage_module.BATCH_WRITE_ATTEMPTS
@@ -0,0 +1,70 @@
+# Copyright 2015 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import os
+import signal
+import threading
+import time
+
+from datalake_ingester.supervisor import IngesterSupervisor
+
+
+def _crash(stop, handled):
+    with handled.get_lock():
+        handled.value += 1
+    os._exit(1)
+
+
+def _finish_in_flight(stop, handled):
+    while not stop.is_set():
+        time.sleep(0.01)
+    # pretend to finish handling the messages in hand
+    time.sleep(0.2)
+    with handled.get_lock():
+        handled.value += 1
+
+
+def _signal_later(signum, delay):
+    t = threading.Timer(delay, os.kill, args=(os.getpid(), signum))
+    t.start()
+    return t
+
+
+def test_restarts_crashed_workers():
+    s = IngesterSupervisor(2, target=_crash, check_interval=0.05)
+    threading.Timer(0.5, s.stop.set).start()
+    s.run()
+    assert all(starts > 1 for starts in s.starts)
+    assert sum(s._counts()) == sum(s.starts)
+
+
+def test_graceful_sigterm():
+    s = IngesterSupervisor(3, target=_finish_in_flight, check_interval=0.05)
+    _signal_later(signal.SIGTERM, 0.5)
+    s.run()
+    assert s.starts == [1, 1, 1]
+    assert s._counts() == [1, 1, 1]
+    assert all(w.exitcode == 0 for w in s._workers)
+
+
+def test_reports_throughput(caplog):
+    s = IngesterSupervisor(2, target=_finish_in_flight, check_interval=0.05,
+                           report_interval=0.1)
+    _signal_later(signal.SIGINT, 0.5)
+    with caplog.at_level('INFO', logger='supervisor'):
+        s.run()
+    reports = [r.getMessage() for r in caplog.records
+               if r.getMessage().startswith('THROUGHPUT')]
+    assert len(reports) > 1
+    assert 'by worker: [1, 1]' in reports[-1]